@@ -0,0 +1,339 @@
+# --- START OF FILE benchmark.py ---
+# 離線的效能基準 / 重播工具 (不需要 Discord，也不需要連線到 rss.app)：
+#   把錄製下來或合成的 YouTube / Instagram / Twitter feed XML 依序送過
+#   解析 → 新 entry 偵測 → HTML 清理 → 時間戳解析 → embed 渲染 → 發送 (送到假的 Discord 頻道)，
+#   回報每個階段的耗時、記憶體用量與端到端每秒通知數，並可從 1 擴充到 10,000 個 feed / 伺服器。
+#
+# 用法：
+#   python benchmark.py                                  # 預設規模
+#   python benchmark.py --feeds 1,100,10000 --guilds 1,10,10000
+#   python benchmark.py --feeds-dir recorded/             # 重播錄製的 XML (檔名以 youtube / instagram / twitter 開頭)
+#   python benchmark.py --save baseline.json              # 儲存結果
+#   python benchmark.py --compare baseline.json           # 與先前的結果比較，退步超過 --tolerance 時 exit code 為 1
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from channel_router import ChannelRouter
+from content_extract import extract_content
+from delivery import DeliveryQueue
+from feed_fetcher import _parse_feed_bytes
+from feed_sources import FeedSource
+from seen_entries import SeenSet, find_new_entries
+from state_store import StateStore
+from timestamps import get_timestamp_from_entry
+
+
+KINDS = ('youtube', 'instagram', 'twitter')
+CHANNEL_NAME = 'sns-updates'
+STAGES = ('route', 'parse', 'detect', 'clean', 'timestamp', 'render', 'deliver')
+
+CONTENT_TYPES = {
+    'youtube': 'application/atom+xml; charset=UTF-8',
+    'instagram': 'application/rss+xml; charset=utf-8',
+    'twitter': 'application/rss+xml; charset=utf-8',
+}
+
+
+# --- 合成的 feed ---
+def _rfc822(epoch):
+    return time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(epoch))
+
+def _iso(epoch):
+    return time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(epoch))
+
+def _html_body(feed_index, n):
+    return (f'&lt;div&gt;&lt;p&gt;Post {n} from account {feed_index} &amp;amp; friends &#8212; '
+            f'&lt;a href="https://example.com/tag/{n}"&gt;#tag{n}&lt;/a&gt; '
+            f'&lt;img src="https://img.example.com/{feed_index}/{n}.jpg"&gt; '
+            f'{"lorem ipsum dolor sit amet " * 8}&lt;/p&gt;&lt;/div&gt;')
+
+def synthetic_feed(kind, feed_index, entries=15, now=None):
+    """產生一份與實際格式相近的 feed XML (bytes)，entry 由新到舊"""
+    now = now or time.time()
+    times = [now - i * 3600 for i in range(entries)]
+    if kind == 'youtube':
+        items = ''.join(
+            f'<entry><id>yt:video:v{feed_index}x{n}</id><yt:videoId>v{feed_index}x{n}</yt:videoId>'
+            f'<yt:channelId>UC{feed_index}</yt:channelId><title>Video {n} of channel {feed_index}</title>'
+            f'<link rel="alternate" href="https://www.youtube.com/watch?v=v{feed_index}x{n}"/>'
+            f'<author><name>Channel {feed_index}</name></author>'
+            f'<published>{_iso(t)}</published><updated>{_iso(t)}</updated>'
+            f'<media:group><media:title>Video {n}</media:title>'
+            f'<media:thumbnail url="https://i.ytimg.com/vi/v{feed_index}x{n}/hqdefault.jpg" width="480" height="360"/>'
+            f'<media:description>Description of video {n}. {"Some more text here. " * 10}</media:description>'
+            f'</media:group></entry>'
+            for n, t in enumerate(times))
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" '
+                'xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">'
+                f'<title>Channel {feed_index}</title>{items}</feed>').encode()
+    media = kind == 'twitter'
+    items = ''.join(
+        f'<item><title>Post {n} of account {feed_index}</title>'
+        f'<link>https://example.com/{kind}/{feed_index}/{n}</link>'
+        f'<guid isPermaLink="false">{kind}-{feed_index}-{n}</guid>'
+        f'<pubDate>{_rfc822(t)}</pubDate><dc:creator>(@account{feed_index})</dc:creator>'
+        f'<description>{_html_body(feed_index, n)}</description>'
+        + (f'<media:content medium="image" url="https://pbs.example.com/{feed_index}/{n}.jpg"/>' if media else '')
+        + '</item>'
+        for n, t in enumerate(times))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:media="http://search.yahoo.com/mrss/">'
+            f'<channel><title>{kind} account {feed_index}</title><link>https://example.com</link>'
+            f'{items}</channel></rss>').encode()
+
+
+def load_recorded(feeds_dir):
+    """讀取錄製的 XML：{kind: [bytes, ...]}，檔名以 kind 開頭 (例如 twitter_nmixx.xml)"""
+    recorded = {}
+    for path in sorted(glob.glob(os.path.join(feeds_dir, '*.xml'))):
+        name = os.path.basename(path).lower()
+        kind = next((kind for kind in KINDS if name.startswith(kind)), None)
+        if kind is None:
+            print(f"Skipping {path}: file name must start with one of {', '.join(KINDS)}")
+            continue
+        with open(path, 'rb') as f:
+            recorded.setdefault(kind, []).append(f.read())
+    return recorded
+
+
+# --- 假的 Discord 物件 ---
+class StubGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f'guild-{guild_id}'
+        self.text_channels = [StubChannel(self, guild_id * 10, CHANNEL_NAME),
+                              StubChannel(self, guild_id * 10 + 1, 'general')]
+
+
+class StubChannel:
+    send_latency = 0.0   # 模擬 Discord API 的延遲 (秒)
+    sends = 0
+
+    def __init__(self, guild, channel_id, name):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+
+    async def send(self, embed=None, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        StubChannel.sends += 1
+
+
+# --- 執行一個規模 ---
+def _feed_bodies(feed_count, entries, recorded):
+    now = time.time()
+    for i in range(feed_count):
+        kind = KINDS[i % len(KINDS)]
+        if recorded:
+            kinds = sorted(recorded)
+            kind = kinds[i % len(kinds)]
+            bodies = recorded[kind]
+            yield kind, bodies[(i // len(kinds)) % len(bodies)]
+        else:
+            yield kind, synthetic_feed(kind, i, entries, now)
+
+
+async def run_scenario(feed_count, guild_count, args, recorded=None):
+    timings = dict.fromkeys(STAGES, 0.0)
+    counts = dict.fromkeys(STAGES, 0)
+    StubChannel.sends = 0
+    StubChannel.send_latency = args.send_latency / 1000
+
+    # 準備輸入 (不計時)：feed XML 與假的伺服器
+    bodies = list(_feed_bodies(feed_count, args.entries, recorded))
+    guilds = [StubGuild(i + 1) for i in range(guild_count)]
+
+    if args.memory:
+        tracemalloc.start()
+    tmp = tempfile.TemporaryDirectory()
+    store = StateStore(os.path.join(tmp.name, 'state.db')).open()
+    unlimited = (10 ** 9, 1.0)
+    queue = DeliveryQueue(store, workers=args.workers, channel_rate=unlimited, global_rate=unlimited)
+    wall_started = time.perf_counter()
+
+    started = time.perf_counter()
+    router = ChannelRouter()
+    sources = []
+    for i, (kind, _) in enumerate(bodies):
+        source = FeedSource(f'{kind}:{i}', kind, f'https://example.com/{kind}/{i}.xml', None, 300)
+        router.set_route(source.key, None, CHANNEL_NAME)
+        sources.append(source)
+    router.rebuild(guilds)
+    timings['route'] += time.perf_counter() - started
+    counts['route'] += guild_count
+
+    deliveries = []
+    for source, (kind, body) in zip(sources, bodies):
+        handler = source.handler
+
+        started = time.perf_counter()
+        feed = _parse_feed_bytes(body, CONTENT_TYPES[kind], source.url)
+        timings['parse'] += time.perf_counter() - started
+        counts['parse'] += 1
+
+        # 除了最新的 args.new 則以外都當成已經看過 (不計時)
+        seen = SeenSet((handler.entry_id(entry) for entry in feed.entries[args.new:]), capacity=500)
+        started = time.perf_counter()
+        new_entries = find_new_entries(feed.entries, handler.entry_id, seen)
+        timings['detect'] += time.perf_counter() - started
+        counts['detect'] += len(feed.entries)
+
+        items = []
+        for entry_id, entry in new_entries:
+            # 個別量測 HTML 清理與時間戳解析；render 階段包含 handler 內部再做一次的完整成本
+            started = time.perf_counter()
+            extract_content(entry.get('summary'))
+            timings['clean'] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            get_timestamp_from_entry(entry, source.key)
+            timings['timestamp'] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            embed = handler.build_embed(source, feed, entry)
+            timings['render'] += time.perf_counter() - started
+            items.append((entry_id, embed))
+        counts['clean'] += len(items)
+        counts['timestamp'] += len(items)
+        counts['render'] += len(items)
+        if items:
+            deliveries.append((source, items))
+
+    started = time.perf_counter()
+    queue.start()
+    await asyncio.gather(*(queue.deliver(source.key, items, router.channels_for(source.key), label=source.key)
+                           for source, items in deliveries))
+    await queue.stop()
+    timings['deliver'] += time.perf_counter() - started
+    counts['deliver'] += StubChannel.sends
+
+    wall = time.perf_counter() - wall_started
+    peak = None
+    if args.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    store.close()
+    tmp.cleanup()
+
+    return {
+        'feeds': feed_count,
+        'guilds': guild_count,
+        'notifications': StubChannel.sends,
+        'wall_seconds': wall,
+        'notifications_per_second': StubChannel.sends / wall if wall else 0.0,
+        'stages': {stage: {'seconds': timings[stage], 'items': counts[stage],
+                           'us_per_item': timings[stage] / counts[stage] * 1e6 if counts[stage] else 0.0}
+                   for stage in STAGES},
+        'peak_traced_bytes': peak,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+
+# --- 報告 ---
+def print_report(result):
+    print(f"\n=== {result['feeds']} feeds × {result['guilds']} guilds: "
+          f"{result['notifications']} notifications in {result['wall_seconds']:.3f}s "
+          f"({result['notifications_per_second']:.0f}/s) ===")
+    print(f"{'stage':<10} {'seconds':>10} {'items':>10} {'µs/item':>12}")
+    for stage, data in result['stages'].items():
+        print(f"{stage:<10} {data['seconds']:>10.4f} {data['items']:>10} {data['us_per_item']:>12.1f}")
+    memory = []
+    if result['peak_traced_bytes'] is not None:
+        memory.append(f"peak traced {result['peak_traced_bytes'] / 1024 / 1024:.1f} MiB")
+    if result['max_rss_kb'] is not None:
+        memory.append(f"max RSS {result['max_rss_kb'] / 1024:.1f} MiB")
+    if memory:
+        print('memory: ' + ', '.join(memory))
+
+
+def compare(results, baseline, tolerance):
+    """回傳退步的項目清單 (每秒通知數下降，或某個階段每個 item 的耗時增加超過 tolerance)"""
+    previous = {(r['feeds'], r['guilds']): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['feeds'], result['guilds']))
+        if old is None:
+            continue
+        scenario = f"{result['feeds']}×{result['guilds']}"
+        if result['notifications_per_second'] < old['notifications_per_second'] * (1 - tolerance):
+            regressions.append(f"{scenario}: notifications/s {old['notifications_per_second']:.0f} → "
+                               f"{result['notifications_per_second']:.0f}")
+        for stage, data in result['stages'].items():
+            old_us = old['stages'].get(stage, {}).get('us_per_item')
+            if old_us and data['us_per_item'] > old_us * (1 + tolerance):
+                regressions.append(f"{scenario}: {stage} {old_us:.1f} → {data['us_per_item']:.1f} µs/item")
+    return regressions
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark for the feed → embed → delivery pipeline')
+    parser.add_argument('--feeds', type=_int_list, default=[1, 10, 100, 1000], help='feed 數量 (逗號分隔)')
+    parser.add_argument('--guilds', type=_int_list, default=[1, 10], help='伺服器數量 (逗號分隔)')
+    parser.add_argument('--entries', type=int, default=15, help='每個合成 feed 的 entry 數量')
+    parser.add_argument('--new', type=int, default=3, help='每個 feed 有幾則新的 entry')
+    parser.add_argument('--workers', type=int, default=4, help='發送 worker 數量')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='模擬每次發送的延遲 (毫秒)')
+    parser.add_argument('--feeds-dir', help='錄製的 feed XML 資料夾 (取代合成的 feed)')
+    parser.add_argument('--memory', action='store_true', help='用 tracemalloc 量測記憶體峰值 (會變慢)')
+    parser.add_argument('--save', help='把結果存成 JSON')
+    parser.add_argument('--compare', help='與先前存下的 JSON 比較')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允許的退步比例 (0.25 = 25%%)')
+    parser.add_argument('--verbose', action='store_true', help='顯示 pipeline 本身的日誌輸出')
+    args = parser.parse_args(argv)
+
+    recorded = load_recorded(args.feeds_dir) if args.feeds_dir else None
+    if args.feeds_dir and not recorded:
+        print(f"No recorded feeds found in {args.feeds_dir}")
+        return 2
+
+    results = []
+    for feed_count in args.feeds:
+        for guild_count in args.guilds:
+            # pipeline 每次發送都會 print，預設丟掉以免 I/O 主導量測結果
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                    contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                result = asyncio.run(run_scenario(feed_count, guild_count, args, recorded))
+            print_report(result)
+            results.append(result)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nPerformance regressions (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# --- END OF FILE benchmark.py ---
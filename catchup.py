@@ -0,0 +1,116 @@
+# --- START OF FILE catchup.py ---
+# 等待發送的新 entry，以及停機 / 斷線後的補發 (catch-up)：
+#   - 啟動或 gateway 斷線太久後重新連線時，一次抓取所有 feed，
+#     以持久化的 seen set 與 high-water mark (最後處理過的 entry 時間) 找出所有錯過的 entry
+#   - 所有 feed 錯過的 entry 依時間合併排序 (merge_chronological)，每個頻道依序發送
+#   - 同一個頻道錯過太多則時，把錯過最多的 feed 改為數則合併成一個摘要 embed (plan_channel)，
+#     避免一次灌進幾十則訊息；實際發送仍經過 DeliveryQueue 的 token bucket 控制速率
+
+import datetime
+import heapq
+import math
+
+import discord
+
+from entry_utils import truncate_text
+
+
+DIGEST_DESCRIPTION_LIMIT = 4000   # embed description 上限是 4096
+
+
+class PendingEntry:
+    """一則錯過、等待補發的 entry"""
+
+    def __init__(self, source, entry_id, embed, timestamp, title='', link=None, keys=()):
+        self.source = source
+        self.entry_id = entry_id
+        self.embed = embed
+        self.timestamp = timestamp    # epoch 秒；沒有時間時為 None
+        self.title = title
+        self.link = link
+        self.keys = keys              # 跨 feed 重複內容比對用的 key
+
+
+class CatchUpMessage:
+    """要送到一個頻道的一則訊息：單一 entry 的 embed，或多則 entry 的摘要"""
+
+    def __init__(self, source, entries, embed, message_id):
+        self.source = source
+        self.entries = entries        # [PendingEntry, ...]，由舊到新
+        self.embed = embed
+        self.message_id = message_id  # 送進 DeliveryQueue 的 ID；單則時就是 entry ID
+
+    @property
+    def sort_key(self):
+        return _sort_key(self.entries[0])
+
+
+def _sort_key(pending):
+    # 沒有時間的 entry 排在最後 (維持各 feed 內原本的順序)
+    return (pending.timestamp is None, pending.timestamp or 0.0)
+
+
+def merge_chronological(batches):
+    """把各 feed 由舊到新排列的 PendingEntry 清單合併成一個依時間排序的清單"""
+    return list(heapq.merge(*batches, key=_sort_key))
+
+
+def build_digest(source, entries, part=1, parts=1):
+    """把同一個 feed 的多則 entry 合併成一個摘要 embed"""
+    name = source.handler.display_name
+    title = f"[{name} 更新] 錯過的 {len(entries)} 則更新 from {source.label}"
+    if parts > 1:
+        title += f" ({part}/{parts})"
+    lines = []
+    length = 0
+    for pending in entries:
+        text = truncate_text(pending.title or pending.link or pending.entry_id, 120)
+        line = f"• [{text}]({pending.link})" if pending.link else f"• {text}"
+        if length + len(line) + 1 > DIGEST_DESCRIPTION_LIMIT:
+            lines.append(f"…以及另外 {len(entries) - len(lines)} 則")
+            break
+        lines.append(line)
+        length += len(line) + 1
+    first_embed = entries[0].embed
+    embed = discord.Embed(title=title, description='\n'.join(lines),
+                          color=first_embed.color if first_embed is not None else None)
+    if entries[-1].timestamp is not None:
+        embed.timestamp = datetime.datetime.fromtimestamp(entries[-1].timestamp, tz=datetime.timezone.utc)
+    embed.set_footer(text=f"{name} 補發摘要")
+    return embed
+
+
+def plan_channel(entries, digest_threshold=5, digest_size=10):
+    """決定一個頻道的補發訊息。entries 為依時間排序的 PendingEntry。
+    訊息數量超過 digest_threshold 時，從錯過最多則的 feed 開始，把該 feed 每 digest_size 則合併成一個摘要，
+    直到訊息數量不超過 digest_threshold (或已經沒有可以合併的 feed)。回傳依時間排序的 CatchUpMessage 清單"""
+    by_source = {}
+    for pending in entries:
+        by_source.setdefault(pending.source.key, []).append(pending)
+    digested = set()
+    message_count = len(entries)
+    if digest_threshold:
+        for key in sorted(by_source, key=lambda key: len(by_source[key]), reverse=True):
+            count = len(by_source[key])
+            if message_count <= digest_threshold or count < 2:
+                break
+            digested.add(key)
+            message_count -= count - math.ceil(count / digest_size)
+
+    messages = []
+    for key, feed_entries in by_source.items():
+        if key not in digested:
+            messages.extend(CatchUpMessage(p.source, [p], p.embed, p.entry_id) for p in feed_entries)
+            continue
+        # 平均分配到最少需要的摘要數量 (11 則 → 6 + 5，而不是 10 + 1)
+        parts = math.ceil(len(feed_entries) / digest_size)
+        size = math.ceil(len(feed_entries) / parts)
+        for part in range(parts):
+            chunk = feed_entries[part * size:(part + 1) * size]
+            source = chunk[0].source
+            message_id = f"digest:{chunk[0].entry_id}..{chunk[-1].entry_id}"
+            messages.append(CatchUpMessage(source, chunk, build_digest(source, chunk, part + 1, parts), message_id))
+    messages.sort(key=lambda message: message.sort_key)
+    return messages
+
+# --- END OF FILE catchup.py ---
@@ -0,0 +1,88 @@
+# --- START OF FILE channel_router.py ---
+# Feed → Discord 頻道的路由索引：
+#   原本每次通知都要掃過所有伺服器的所有頻道 (O(guilds × channels))。
+#   這裡在 on_ready 時建立一次索引，之後只根據 guild / channel 事件做增量更新，
+#   發送時直接查表取得目標頻道。
+#   頻道可以用 ID 指定 (建議)，沒有設定 ID 時才退回用頻道名稱比對。
+
+
+class ChannelRouter:
+    def __init__(self):
+        self._routes = {}         # route_key -> (frozenset(channel_ids), channel_name)
+        self._wanted_ids = set()
+        self._wanted_names = set()
+        self._by_id = {}          # channel_id -> channel (只收錄有路由用到的頻道)
+        self._by_name = {}        # channel_name -> {channel_id: channel}
+
+    # --- 路由設定 ---
+    def set_route(self, route_key, channel_ids=(), channel_name=None):
+        """設定一個 feed 要送到哪些頻道。有 channel_ids 時忽略 channel_name"""
+        channel_ids = frozenset(int(channel_id) for channel_id in channel_ids or ())
+        self._routes[route_key] = (channel_ids, None if channel_ids else channel_name)
+        self._refresh_wanted()
+
+    def remove_route(self, route_key):
+        self._routes.pop(route_key, None)
+        self._refresh_wanted()
+
+    def _refresh_wanted(self):
+        self._wanted_ids = set()
+        self._wanted_names = set()
+        for channel_ids, channel_name in self._routes.values():
+            self._wanted_ids |= channel_ids
+            if channel_name:
+                self._wanted_names.add(channel_name)
+
+    # --- 查詢 ---
+    def channels_for(self, route_key):
+        route = self._routes.get(route_key)
+        if route is None:
+            return []
+        channel_ids, channel_name = route
+        if channel_ids:
+            return [self._by_id[channel_id] for channel_id in channel_ids if channel_id in self._by_id]
+        return list(self._by_name.get(channel_name, {}).values())
+
+    # --- 索引維護 ---
+    def rebuild(self, guilds):
+        """重新建立整個索引 (on_ready 時呼叫)"""
+        self._by_id = {}
+        self._by_name = {}
+        for guild in guilds:
+            self.add_guild(guild)
+        print(f"Channel routing index built: {len(self._by_id)} channels across {len(self._routes)} routes")
+        return list(self._by_id.values())
+
+    def add_guild(self, guild):
+        """索引一個伺服器的頻道，回傳被收錄的頻道"""
+        return [channel for channel in guild.text_channels if self.add_channel(channel)]
+
+    def remove_guild(self, guild):
+        for channel_id in [cid for cid, channel in self._by_id.items() if channel.guild.id == guild.id]:
+            self._discard(channel_id)
+
+    def add_channel(self, channel):
+        """頻道有被任何路由用到時收錄並回傳 True"""
+        if channel.id not in self._wanted_ids and channel.name not in self._wanted_names:
+            return False
+        self._by_id[channel.id] = channel
+        if channel.name in self._wanted_names:
+            self._by_name.setdefault(channel.name, {})[channel.id] = channel
+        return True
+
+    def remove_channel(self, channel):
+        self._discard(channel.id)
+
+    def update_channel(self, before, after):
+        # 名稱可能改變，先移除舊的索引再重新加入
+        self._discard(before.id)
+        return self.add_channel(after)
+
+    def _discard(self, channel_id):
+        channel = self._by_id.pop(channel_id, None)
+        if channel is None:
+            return
+        for channels in self._by_name.values():
+            channels.pop(channel_id, None)
+
+# --- END OF FILE channel_router.py ---
@@ -0,0 +1,149 @@
+# --- START OF FILE content_extract.py ---
+# Entry 內容的單次 HTML 處理：
+#   原本每則 entry 會用 BeautifulSoup 建兩次完整的 DOM (一次清理文字、一次找 img)。
+#   這裡用標準庫的串流式 HTMLParser 掃過一次，同時取得：
+#     - 清理後的文字 (與 BeautifulSoup(...).get_text(separator=' ', strip=True) 相同)
+#     - 第一個 <img> 的 src (與 soup.find('img').get('src') 相同)
+#     - 所有 <a href> 連結
+#   不需要建樹，也不再依賴 beautifulsoup4。
+
+from html.entities import html5 as _HTML5_ENTITIES
+from html.parser import HTMLParser
+
+
+# BeautifulSoup 不會把這些標籤內的字串算進 get_text()
+_SKIPPED_TEXT_TAGS = ('script', 'style', 'template')
+
+
+class ExtractedContent:
+    def __init__(self, text='', image_url=None, links=()):
+        self.text = text
+        self.image_url = image_url
+        self.links = list(links)     # [(href, 連結文字), ...]
+
+    def __repr__(self):
+        return f"<ExtractedContent text={self.text[:30]!r} image_url={self.image_url!r} links={len(self.links)}>"
+
+
+class _ContentParser(HTMLParser):
+    def __init__(self):
+        # 自己處理字元參照，才能與 BeautifulSoup 對未知實體 (例如 &foo;) 的處理方式一致
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.image_url = None
+        self.links = []
+        self._buffer = []
+        self._skip_depth = 0
+        self._seen_img = False
+        self._link_href = None
+        self._link_text = []
+
+    # 連續的文字先累積起來，遇到標籤邊界時才當成一個字串 (與 BeautifulSoup 的 NavigableString 一致)
+    def _flush(self):
+        if not self._buffer:
+            return
+        text = ''.join(self._buffer).strip()
+        self._buffer = []
+        if text and not self._skip_depth:
+            self.strings.append(text)
+            if self._link_href is not None:
+                self._link_text.append(text)
+
+    def handle_data(self, data):
+        self._buffer.append(data)
+
+    def handle_entityref(self, name):
+        character = _HTML5_ENTITIES.get(name + ';') or _HTML5_ENTITIES.get(name)
+        self._buffer.append(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        try:
+            codepoint = int(name[1:], 16) if name[:1] in ('x', 'X') else int(name)
+        except ValueError:
+            self._buffer.append(f"&#{name};")
+            return
+        data = None
+        if 0 < codepoint < 256:
+            # 數字參照有時其實是 windows-1252 (例如 &#150;)
+            try:
+                data = bytes([codepoint]).decode('windows-1252')
+            except UnicodeDecodeError:
+                data = None
+        if not data and codepoint:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                data = None
+        self._buffer.append(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in _SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'img' and not self._seen_img:
+            # 只看第一個 <img>；重複的屬性以最後一個為準
+            self._seen_img = True
+            self.image_url = dict(attrs).get('src') or None
+        elif tag == 'a':
+            self._close_link()
+            self._link_href = dict(attrs).get('href') or ''
+            self._link_text = []
+
+    def handle_startendtag(self, tag, attrs):
+        # <img ... /> 這種自我結束的標籤不會有對應的 end tag
+        self.handle_starttag(tag, attrs)
+        if tag in _SKIPPED_TEXT_TAGS:
+            self._skip_depth -= 1
+        elif tag == 'a':
+            self._close_link()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in _SKIPPED_TEXT_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'a':
+            self._close_link()
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        # <![CDATA[...]]> 的內容會被 BeautifulSoup 當成文字
+        if data.startswith('CDATA['):
+            self._buffer.append(data[len('CDATA['):])
+            self._flush()
+
+    def _close_link(self):
+        if self._link_href is not None:
+            self.links.append((self._link_href, ' '.join(self._link_text)))
+        self._link_href = None
+        self._link_text = []
+
+    def finish(self):
+        self.close()
+        self._flush()
+        self._close_link()
+
+
+def extract_content(raw_html):
+    """只解析一次 HTML，回傳 ExtractedContent(text, image_url, links)。
+    解析失敗時 text 為原始字串 (與舊版 clean_html 的行為相同)"""
+    if not raw_html:
+        return ExtractedContent()
+    parser = _ContentParser()
+    try:
+        parser.feed(raw_html)
+        parser.finish()
+    except Exception as e:
+        print(f"Error cleaning HTML: {e}")
+        return ExtractedContent(raw_html)
+    return ExtractedContent(' '.join(parser.strings), parser.image_url, parser.links)
+
+# --- END OF FILE content_extract.py ---
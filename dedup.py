@@ -0,0 +1,156 @@
+# --- START OF FILE dedup.py ---
+# 跨 feed 的重複內容合併：
+#   同一則內容常常出現在好幾個 feed (兩個 Twitter feed 轉推同一則推文、Instagram 貼文同步到 Twitter)，
+#   每個 feed 各自通知會讓同一個頻道收到好幾次。
+#   這裡為每則新 entry 計算幾個 key：
+#     - 正規化後的 canonical URL (去掉追蹤參數、x.com → twitter.com、推文只看 status ID 等)
+#     - 內文的指紋 (清理 HTML、移除網址與標點、轉小寫後的 hash；太短的內文不算；
+#       handler 可以關閉，例如 YouTube 的影片說明多半是樣板文字)
+#   在發送之前向共用的 DedupIndex 認領 (key, 頻道)；時間窗內已經被別的 entry 認領的頻道不再發送，
+#   所以每個頻道只會收到一次通知。同一個 feed 的不同 entry 不會互相合併 (同一個頻道的樣板文字不算重複)。
+
+import collections
+import hashlib
+import re
+import time
+import unicodedata
+import urllib.parse
+
+from content_extract import extract_content
+
+
+# 追蹤用、不影響內容的 query 參數
+_TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'igsh', 'ref', 'ref_src', 'ref_url', 's', 't', 'si', 'feature'}
+_HOST_ALIASES = {'x.com': 'twitter.com', 'youtu.be': 'youtube.com'}
+_HOST_PREFIXES = ('www.', 'mobile.', 'm.')
+_TWEET_PATH = re.compile(r'^/[^/]+/status(?:es)?/(\d+)')
+_URL_IN_TEXT = re.compile(r'https?://\S+|pic\.twitter\.com/\S+')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def canonical_url(url):
+    """把同一則內容的不同 URL 寫法正規化成同一個字串；無法解析時回傳 None"""
+    if not url:
+        return None
+    try:
+        parsed = urllib.parse.urlsplit(url.strip())
+    except ValueError:
+        return None
+    raw_host = (parsed.hostname or '').lower()
+    if not raw_host:
+        return None
+    host = raw_host
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    host = _HOST_ALIASES.get(host, host)
+    path = parsed.path.rstrip('/') or '/'
+    query = [(key, value) for key, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+             if key not in _TRACKING_PARAMS and not key.startswith('utm_')]
+
+    if host == 'twitter.com':
+        # 同一則推文可能以不同帳號名稱出現 (轉推)，只看 status ID
+        match = _TWEET_PATH.match(path)
+        if match:
+            return f'twitter.com/i/status/{match.group(1)}'
+    elif host == 'youtube.com':
+        video_id = None
+        if raw_host == 'youtu.be':
+            video_id = path.strip('/')
+        elif path.startswith('/shorts/'):
+            video_id = path[len('/shorts/'):]
+        elif path == '/watch':
+            video_id = dict(query).get('v')
+        if video_id:
+            return f'youtube.com/watch?v={video_id}'
+    elif host == 'instagram.com':
+        # /{帳號}/p/{code} 與 /p/{code} 是同一則貼文
+        match = re.search(r'/(p|reel|tv)/([^/]+)', path)
+        if match:
+            return f'instagram.com/{match.group(1)}/{match.group(2)}'
+
+    query_string = urllib.parse.urlencode(sorted(query))
+    return f'{host}{path}' + (f'?{query_string}' if query_string else '')
+
+
+def content_fingerprint(text, min_length=20):
+    """內文的指紋；正規化之後少於 min_length 個字元時回傳 None (太短容易誤判)"""
+    if not text:
+        return None
+    text = unicodedata.normalize('NFKC', text)
+    text = _URL_IN_TEXT.sub(' ', text)
+    text = _NON_WORD.sub(' ', text).strip().lower()
+    if len(text) < min_length:
+        return None
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def entry_keys(entry, min_text_length=20, text=True):
+    """一則 feed entry 用來比對重複的 key 清單；text 為 False 時不包含內文指紋"""
+    keys = []
+    url = canonical_url(entry.get('link'))
+    if url:
+        keys.append(f'url:{url}')
+    if not text:
+        return keys
+    summary = entry.get('summary')
+    text = extract_content(summary).text if summary else entry.get('title')
+    fingerprint = content_fingerprint(text, min_text_length)
+    if fingerprint:
+        keys.append(f'text:{fingerprint}')
+    return keys
+
+
+class DedupIndex:
+    """所有 feed 共用的 (key, 頻道) 認領表，認領在 window 秒後過期"""
+
+    def __init__(self, window=6 * 3600):
+        self.window = window
+        self._claims = {}                       # (key, channel_id) -> ((feed_key, entry_id), 過期時間)
+        self._expiry = collections.deque()      # (過期時間, (key, channel_id))，依時間排序
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._claims)
+
+    def _expire(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, claim_key = self._expiry.popleft()
+            claim = self._claims.get(claim_key)
+            if claim is not None and claim[1] == expires_at:
+                del self._claims[claim_key]
+
+    def claim(self, feed_key, entry_id, keys, channel_ids):
+        """為這則 entry 認領每個頻道；回傳 {channel_id: 先認領的 (feed_key, entry_id)}，
+        這些頻道在時間窗內已經 (或正在) 收到同樣的內容，不需要再發送。
+        同一個 feed 的其他 entry 的認領不算重複 (同一個 feed 不會把同一則內容發兩次)"""
+        now = time.monotonic()
+        self._expire(now)
+        owner = (feed_key, entry_id)
+        duplicates = {}
+        for channel_id in channel_ids:
+            for key in keys:
+                claim = self._claims.get((key, channel_id))
+                if claim is not None and claim[0][0] != feed_key:
+                    duplicates[channel_id] = claim[0]
+                    break
+        expires_at = now + self.window
+        for channel_id in channel_ids:
+            if channel_id in duplicates:
+                continue
+            for key in keys:
+                self._claims[(key, channel_id)] = (owner, expires_at)
+                self._expiry.append((expires_at, (key, channel_id)))
+        self.coalesced += len(duplicates)
+        return duplicates
+
+    def release(self, feed_key, entry_id, keys, channel_id):
+        """發送失敗時放棄認領，讓之後的重試 (或其他 feed 的同一內容) 可以再發送"""
+        owner = (feed_key, entry_id)
+        for key in keys:
+            claim = self._claims.get((key, channel_id))
+            if claim is not None and claim[0] == owner:
+                del self._claims[(key, channel_id)]
+
+# --- END OF FILE dedup.py ---
@@ -0,0 +1,309 @@
+# --- START OF FILE delivery.py ---
+# Discord 發送子系統：
+#   - asyncio.Queue + 一組 sender worker，一則通知同時送往多個頻道
+#   - 每個頻道與全域各有一個 token bucket，主動控制發送速率，避免觸發 429
+#   - discord.HTTPException (429 / 5xx) 時以指數退避重試；discord.Forbidden / NotFound 視為永久失敗，不再重試
+#   - 透過 StateStore 的發送記錄，已經送達的 (entry, 頻道) 不會因為重試而重複發送
+#   - 同一個頻道的多則 entry 由同一個 job 依序處理，保持時間順序；
+#     還在排隊的 job 會合併之後送到同一個頻道的 job (不論來自哪個 feed)，
+#     webhook 頻道的新 job 會先等 coalesce_delay 秒收集其他 feed 的更新；
+#     webhook 模式下一次請求最多合併 10 個 embed (總字數不超過 6000)
+
+import asyncio
+import random
+import time
+
+import discord
+
+from webhooks import WEBHOOK_MAX_EMBED_CHARS, WEBHOOK_MAX_EMBEDS
+
+
+# 發送結果
+SENT = 'sent'              # 這次成功送出
+DUPLICATE = 'duplicate'    # 之前已經送過，略過
+FORBIDDEN = 'forbidden'    # 永久失敗 (沒有權限 / 頻道不存在)，不會再重試
+REJECTED = 'rejected'      # 其他 4xx (例如 embed 格式錯誤)，重試也不會成功
+FAILED = 'failed'          # 暫時性失敗且重試次數用完，下一次輪詢會再試
+COALESCED = 'coalesced'    # 同樣的內容已經由其他 feed 送到這個頻道，略過
+
+DELIVERED_RESULTS = (SENT, DUPLICATE, COALESCED)
+FINAL_RESULTS = (SENT, DUPLICATE, COALESCED, FORBIDDEN, REJECTED)
+
+
+def _take_batch(pending, limit):
+    """從 pending 開頭取出一批：最多 limit 則，而且 embed 字數總和不超過 WEBHOOK_MAX_EMBED_CHARS (至少一則)"""
+    batch = pending[:1]
+    total = len(pending[0][2])
+    for item in pending[1:limit]:
+        total += len(item[2])
+        if total > WEBHOOK_MAX_EMBED_CHARS:
+            break
+        batch.append(item)
+    return batch
+
+
+class TokenBucket:
+    """簡單的 token bucket：每 per 秒最多 rate 次"""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+    def penalize(self, seconds):
+        # 收到 429 時把 bucket 清空，並讓它在 seconds 秒後才開始回補
+        self._tokens = 0.0
+        self._updated = max(self._updated, time.monotonic() + seconds)
+
+
+class DeliveryJob:
+    """一個頻道要依序送出的一批 entry (可能來自多個 feed)"""
+
+    def __init__(self, channel, items, labels, futures, skip=()):
+        self.channel = channel
+        self.items = items          # [(feed_key, entry_id, embed), ...]，由舊到新
+        self.labels = labels
+        self.futures = futures      # (feed_key, entry_id) -> future
+        self.skip = set(skip)       # 這個頻道不需要發送的 (feed_key, entry_id) (跨 feed 的重複內容)
+        self.attempts = 0
+
+    @property
+    def label(self):
+        return ', '.join(self.labels)
+
+    def merge(self, other):
+        """把之後送到同一個頻道的 job 接在後面 (只能在開始發送之前)"""
+        self.items.extend(other.items)
+        self.labels.extend(label for label in other.labels if label not in self.labels)
+        self.futures.update(other.futures)
+        self.skip |= other.skip
+
+
+class DeliveryQueue:
+    def __init__(self, state_store, workers=4, max_retries=4, backoff_base=2.0,
+                 channel_rate=(5, 5.0), global_rate=(40, 1.0), webhooks=None, metrics=None,
+                 coalesce_delay=0.0):
+        self.state_store = state_store
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.channel_rate = channel_rate       # (次數, 秒)：單一頻道的速率上限
+        self.webhooks = webhooks               # WebhookRegistry；None 表示只用 bot 發送
+        self.metrics = metrics                 # Metrics；None 表示不記錄
+        self.coalesce_delay = coalesce_delay   # webhook 頻道的新 job 等待多久再發送，以合併其他 feed 的更新
+        self._waiting = {}                     # channel_id -> 還沒開始發送、可以再合併的 job
+        self._global_bucket = TokenBucket(*global_rate)
+        self._channel_buckets = {}
+        self._queue = None
+        self._tasks = []
+
+    # --- 生命週期 ---
+    def is_running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self.is_running():
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(), name=f'delivery-worker-{i}')
+                       for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- 對外介面 ---
+    async def deliver(self, feed_key, items, channels, label='', skip=None):
+        """把多則 entry ([(entry_id, embed), ...]，由舊到新) 同時送到多個頻道，
+        等待全部完成後回傳 {entry_id: {channel_id: 結果}}。
+        skip 為 {channel_id: {entry_id, ...}}，這些組合不發送，結果為 COALESCED"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        results = {entry_id: {} for entry_id, _ in items}
+        pending = []
+        for channel in channels:
+            futures = {(feed_key, entry_id): loop.create_future() for entry_id, _ in items}
+            channel_skip = {(feed_key, entry_id) for entry_id in (skip or {}).get(channel.id, ())}
+            self._enqueue(DeliveryJob(channel, [(feed_key, entry_id, embed) for entry_id, embed in items],
+                                      [label], dict(futures), channel_skip))
+            pending.append((channel.id, futures))
+        for channel_id, futures in pending:
+            for (_, entry_id), future in futures.items():
+                results[entry_id][channel_id] = await future
+        return results
+
+    # --- 內部 ---
+    def _enqueue(self, job):
+        channel_id = job.channel.id
+        waiting = self._waiting.get(channel_id)
+        if waiting is not None:
+            if waiting.futures.keys().isdisjoint(job.futures):
+                # 同一個頻道已經有 job 在排隊：合併成同一批發送 (webhook 可以合併成一次請求)
+                waiting.merge(job)
+            else:
+                # 同一則 entry 已經在排隊 (例如補發與輪詢同時)：分開處理，發送記錄會避免重複
+                self._queue.put_nowait(job)
+            return
+        self._waiting[channel_id] = job
+        if self.coalesce_delay and self.webhooks is not None and self.webhooks.get(channel_id) is not None:
+            asyncio.get_running_loop().call_later(self.coalesce_delay, self._queue.put_nowait, job)
+        else:
+            self._queue.put_nowait(job)
+
+    def _channel_bucket(self, channel_id):
+        bucket = self._channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._channel_buckets[channel_id] = TokenBucket(*self.channel_rate)
+        return bucket
+
+    def _finish(self, job, item, result):
+        future = job.futures.get(item[:2])
+        if future is not None and not future.done():
+            future.set_result(result)
+            if self.metrics is not None:
+                self.metrics.inc('delivery_results_total', result=result)
+
+    def _finish_all(self, job, items, result):
+        for item in items:
+            self._finish(job, item, result)
+
+    def _retry_later(self, job, delay):
+        loop = asyncio.get_running_loop()
+        loop.call_later(delay, self._queue.put_nowait, job)
+
+    def _backoff(self, job, error):
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is None and getattr(error, 'response', None) is not None:
+            try:
+                retry_after = float(error.response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+        delay = self.backoff_base ** job.attempts + random.uniform(0, 1)
+        return max(delay, retry_after or 0)
+
+    def _handle_retryable(self, job, bucket, error, status, text):
+        channel = job.channel
+        if job.attempts > self.max_retries:
+            print(f"HTTP 錯誤 ({status}): 無法在 {channel.guild.name}/{channel.name} 發送更新 for {job.label}: {text}. 重試次數已用完")
+            self._finish_all(job, job.items, FAILED)
+            return
+        delay = self._backoff(job, error)
+        if self.metrics is not None:
+            self.metrics.inc('delivery_retries_total', status=str(status))
+        if status == 429:
+            bucket.penalize(delay)
+        print(f"HTTP 錯誤 ({status}): 無法在 {channel.guild.name}/{channel.name} 發送更新 for {job.label}, "
+              f"{delay:.1f} 秒後重試 (第 {job.attempts} 次)")
+        self._retry_later(job, delay)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if self._waiting.get(job.channel.id) is job:
+                # 開始發送之後不再合併；之後的 job 另外排隊
+                del self._waiting[job.channel.id]
+            if self.metrics is not None:
+                self.metrics.set_gauge('delivery_queue_depth', self._queue.qsize())
+            try:
+                await self._send(job)
+            except asyncio.CancelledError:
+                self._finish_all(job, job.items, FAILED)
+                raise
+            except Exception as e:
+                print(f"未知錯誤在發送更新到 {job.channel.guild.name}/{job.channel.name}: {e}")
+                self._finish_all(job, job.items, FAILED)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, job):
+        channel = job.channel
+        guild = channel.guild
+        pending = []
+        for item in job.items:
+            feed_key, entry_id, _ = item
+            if (feed_key, entry_id) in job.skip:
+                self._finish(job, item, COALESCED)
+            elif self.state_store.has_delivery(feed_key, entry_id, channel.id):
+                self._finish(job, item, DUPLICATE)
+            else:
+                pending.append(item)
+
+        webhook = self.webhooks.get(channel.id) if self.webhooks is not None else None
+        bucket = self._channel_bucket(channel.id)
+        batch_limit = WEBHOOK_MAX_EMBEDS
+        while pending:
+            batch = _take_batch(pending, batch_limit if webhook else 1)
+            if webhook is None:
+                # webhook 有自己的 rate-limit，不佔用 bot 的全域額度
+                await self._global_bucket.acquire()
+            await bucket.acquire()
+            job.attempts += 1
+            started = time.perf_counter()
+            try:
+                if webhook is not None:
+                    await self.webhooks.send(webhook, [embed for _, _, embed in batch])
+                else:
+                    await channel.send(embed=batch[0][2])
+            except discord.NotFound as e:
+                if webhook is not None:
+                    # webhook 已被刪除：清掉快取，這次改用 bot 發送
+                    print(f"Webhook for {guild.name}/{channel.name} no longer exists. Falling back to bot send.")
+                    self.webhooks.forget(channel.id)
+                    webhook = None
+                    continue
+                print(f"權限錯誤: 無法在 {guild.name}/{channel.name} 發送更新 for {job.label} ({e.status}). 不再重試.")
+                self._finish_all(job, pending, FORBIDDEN)
+                return
+            except discord.Forbidden as e:
+                print(f"權限錯誤: 無法在 {guild.name}/{channel.name} 發送更新 for {job.label} ({e.status}). 不再重試.")
+                self._finish_all(job, pending, FORBIDDEN)
+                return
+            except discord.RateLimited as e:
+                # discord.py 判斷需要等待太久時會直接拋出，改由這裡排程重試
+                job.items = pending
+                self._handle_retryable(job, bucket, e, 429, 'rate limited')
+                return
+            except discord.HTTPException as e:
+                if e.status == 429 or e.status >= 500:
+                    job.items = pending
+                    self._handle_retryable(job, bucket, e, e.status, e.text)
+                    return
+                if len(batch) > 1:
+                    # 合併的請求被拒絕：不知道是哪一則的問題，剩下的改為逐則發送
+                    print(f"HTTP 錯誤 ({e.status}): {guild.name}/{channel.name} 拒絕了 {len(batch)} 個 embed 的合併請求 "
+                          f"for {job.label}: {e.text}. 改為逐則發送")
+                    batch_limit = 1
+                    continue
+                print(f"HTTP 錯誤 ({e.status}): 無法在 {guild.name}/{channel.name} 發送更新 for {job.label}: {e.text}")
+                self._finish_all(job, batch, REJECTED)
+                pending = pending[len(batch):]
+                continue
+
+            if self.metrics is not None:
+                self.metrics.observe('delivery_send_seconds', time.perf_counter() - started,
+                                     channel=str(channel.id), via='webhook' if webhook is not None else 'bot')
+            for item in batch:
+                feed_key, entry_id, _ = item
+                self.state_store.record_delivery(feed_key, entry_id, channel.id)
+                self._finish(job, item, SENT)
+            via = f" via webhook ({len(batch)} embeds)" if webhook is not None else ""
+            print(f"Sent update for {job.label} to {guild.name}/{channel.name}{via}")
+            pending = pending[len(batch):]
+            job.attempts = 0
+
+# --- END OF FILE delivery.py ---
@@ -0,0 +1,24 @@
+# --- START OF FILE entry_utils.py ---
+# Feed entry 共用的小工具：HTML 清理、文字截斷 (時間戳解析在 timestamps.py)
+
+from content_extract import extract_content
+
+
+# --- Helper function to clean HTML ---
+def clean_html(raw_html):
+    # 只需要文字時的捷徑；同時需要圖片/連結時請直接用 extract_content，避免重複解析
+    return extract_content(raw_html).text
+
+# --- Helper function to truncate text ---
+def truncate_text(text, max_length):
+    if not text: return ""
+    if len(text) <= max_length:
+        return text
+    # 嘗試在最後一個空格處截斷
+    truncated = text[:max_length].rsplit(' ', 1)[0]
+    # 如果截斷後太短（比如第一句很長），就直接截斷
+    if len(truncated) < max_length * 0.8:
+         truncated = text[:max_length]
+    return truncated + " ..."
+
+# --- END OF FILE entry_utils.py ---
@@ -0,0 +1,174 @@
+# --- START OF FILE feed_config.py ---
+# 可熱重載的 feed 設定：
+#   - feed 與頻道設定可以放在外部的 JSON 檔 (預設 feeds.json)，內容會覆蓋 main.py 裡 config 的同名項目
+#   - 執行中定期檢查檔案的修改時間，變更時重新讀取並與目前的 feed 比較 (diff_sources)，
+#     只新增 / 移除 / 調整有變化的 feed，其他 feed 完全不受影響
+#   - 檔案格式錯誤 (JSON 錯誤、未知的 key、feed 缺少 url、頻道 ID 不是數字等) 時保留目前的設定，不會讓 bot 停止
+#
+# feeds.json 範例：
+#   {
+#     "check_interval": 300,
+#     "youtube_rss": "https://www.youtube.com/feeds/videos.xml?channel_id=...",
+#     "instagram_rss": {"url": "https://rss.app/feeds/....xml", "interval": 600},
+#     "twitter_rss": ["https://rss.app/feeds/....xml", {"url": "...", "channel_ids": [123]}],
+#     "twitter_channel_name": "sns更新"
+#   }
+
+import asyncio
+import json
+import os
+
+
+# 可以在 feed 設定檔中覆蓋的 config 項目
+FEED_CONFIG_KEYS = (
+    'check_interval',
+    'youtube_rss', 'instagram_rss', 'twitter_rss',
+    'youtube_channel_ids', 'instagram_channel_ids', 'twitter_channel_ids',
+    'youtube_channel_name', 'instagram_channel_name', 'twitter_channel_name',
+)
+_FEED_KEYS = ('youtube_rss', 'instagram_rss')
+_CHANNEL_IDS_KEYS = ('youtube_channel_ids', 'instagram_channel_ids', 'twitter_channel_ids')
+_CHANNEL_NAME_KEYS = ('youtube_channel_name', 'instagram_channel_name', 'twitter_channel_name')
+
+
+def _check_interval(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{where} must be a positive number of seconds, got {value!r}")
+
+def _check_channel_ids(value, where):
+    if not isinstance(value, list):
+        raise ValueError(f"{where} must be a list of channel IDs, got {value!r}")
+    for channel_id in value:
+        if isinstance(channel_id, bool) or not (isinstance(channel_id, int) or
+                                                (isinstance(channel_id, str) and channel_id.isdigit())):
+            raise ValueError(f"{where} contains an invalid channel ID {channel_id!r}")
+
+def _check_feed(value, where):
+    # 與 feed_sources._feed_entry 接受的格式相同：URL 字串，或 {'url': ..., 'interval': ..., 'channel_ids': [...]}
+    if isinstance(value, str):
+        if not value:
+            raise ValueError(f"{where} must not be empty")
+        return
+    if not isinstance(value, dict):
+        raise ValueError(f"{where} must be a URL or an object with a 'url', got {value!r}")
+    unknown = sorted(set(value) - {'url', 'interval', 'channel_ids'})
+    if unknown:
+        raise ValueError(f"unknown keys in {where}: {', '.join(unknown)}")
+    if not isinstance(value.get('url'), str) or not value['url']:
+        raise ValueError(f"{where} needs a 'url' string")
+    if value.get('interval') is not None:
+        _check_interval(value['interval'], f"{where}.interval")
+    if value.get('channel_ids') is not None:
+        _check_channel_ids(value['channel_ids'], f"{where}.channel_ids")
+
+def validate_feed_config(values, path='feed config'):
+    """檢查 feed 設定的內容；有錯誤時拋出 ValueError (不修改任何設定)"""
+    if not isinstance(values, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+    unknown = sorted(set(values) - set(FEED_CONFIG_KEYS))
+    if unknown:
+        raise ValueError(f"unknown keys in {path}: {', '.join(unknown)}")
+    if values.get('check_interval') is not None:
+        _check_interval(values['check_interval'], f"'check_interval' in {path}")
+    for key in _FEED_KEYS:
+        if values.get(key):
+            _check_feed(values[key], f"'{key}' in {path}")
+    if 'twitter_rss' in values:
+        if not isinstance(values['twitter_rss'], list):
+            raise ValueError(f"'twitter_rss' in {path} must be a list")
+        for index, value in enumerate(values['twitter_rss']):
+            _check_feed(value, f"'twitter_rss'[{index}] in {path}")
+    for key in _CHANNEL_IDS_KEYS:
+        if values.get(key) is not None:
+            _check_channel_ids(values[key], f"'{key}' in {path}")
+    for key in _CHANNEL_NAME_KEYS:
+        if values.get(key) is not None and not isinstance(values[key], str):
+            raise ValueError(f"'{key}' in {path} must be a string")
+
+
+def load_feed_config(path):
+    """讀取並檢查 feed 設定檔；檔案不存在時回傳空 dict，格式或內容錯誤時拋出 ValueError"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            values = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON in {path}: {e}") from e
+    validate_feed_config(values, path)
+    return values
+
+
+def diff_sources(current, updated):
+    """比較兩組 FeedSource (以 key 對應)，回傳 (added, removed, retuned, moved)：
+    retuned 是 URL 相同但間隔 / 頻道 / 名稱改變的 (目前的, 新的) 配對；moved 是 URL 改變的配對"""
+    current_by_key = {source.key: source for source in current}
+    updated_by_key = {source.key: source for source in updated}
+    added = [source for key, source in updated_by_key.items() if key not in current_by_key]
+    removed = [source for key, source in current_by_key.items() if key not in updated_by_key]
+    retuned = []
+    moved = []
+    for key, new in updated_by_key.items():
+        old = current_by_key.get(key)
+        if old is None:
+            continue
+        if old.url != new.url:
+            moved.append((old, new))
+        elif (old.interval, old.channel_ids, old.label) != (new.interval, new.channel_ids, new.label):
+            retuned.append((old, new))
+    return added, removed, retuned, moved
+
+
+class FeedConfigWatcher:
+    """定期檢查設定檔的修改時間，變更時呼叫 async def on_change(values)"""
+
+    def __init__(self, path, on_change, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._on_change = on_change
+        self._mtime = self._current_mtime()   # 啟動時已經讀過的版本不需要再套用
+        self._task = None
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='feed-config-watcher')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def check(self):
+        """檔案有變化時重新讀取並套用；回傳是否套用了新的設定"""
+        mtime = self._current_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            values = load_feed_config(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Feed config reload failed, keeping the current feeds: {e}")
+            return False
+        print(f"Feed config {self.path} changed. Reloading...")
+        await self._on_change(values)
+        return True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Error applying feed config from {self.path}: {e}")
+
+# --- END OF FILE feed_config.py ---
@@ -0,0 +1,208 @@
+# --- START OF FILE feed_fetcher.py ---
+# 非同步 RSS 抓取層：
+#   - 使用共用、keep-alive 的 aiohttp session 下載 feed，不阻塞 discord.py 的 event loop
+#   - 每個請求都有獨立的 timeout
+#   - 支援 conditional GET (ETag / Last-Modified)，304 時完全跳過解析
+#   - 下載完成的 bytes 才交給 feedparser，並且在 worker thread / process pool 中解析
+
+import asyncio
+import concurrent.futures
+import datetime
+import email.utils
+import functools
+import re
+import time
+
+import aiohttp
+
+
+# 與 feedparser 預設相同的 User-Agent；寫成常數，發出請求時不需要在 event loop 上載入 feedparser
+DEFAULT_USER_AGENT = 'feedparser/6.0.14 +https://github.com/kurtmckee/feedparser/'
+
+
+class FetchResult:
+    """一次 feed 抓取的結果。抓取失敗時 feed 為 None，error 記錄原因"""
+
+    def __init__(self, url, status=None, feed=None, headers=None, body_size=0, error=None,
+                 fetch_time=None, parse_time=None):
+        self.url = url
+        self.status = status
+        self.feed = feed
+        self.headers = headers or {}
+        self.body_size = body_size
+        self.error = error
+        self.fetch_time = fetch_time    # 下載花費的秒數 (包含等待連線)
+        self.parse_time = parse_time    # 解析花費的秒數；沒有解析時為 None
+
+    @property
+    def ok(self):
+        return self.feed is not None
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+    @property
+    def etag(self):
+        return self.headers.get('ETag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('Last-Modified')
+
+    @property
+    def entries(self):
+        return self.feed.entries if self.feed is not None else []
+
+    # --- 伺服器提供的輪詢提示 (秒)，沒有時為 None ---
+    @property
+    def rate_limited(self):
+        return self.status == 429 or (self.status == 503 and self.retry_after is not None)
+
+    @property
+    def retry_after(self):
+        value = self.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+    @property
+    def max_age(self):
+        match = re.search(r'max-age=(\d+)', self.headers.get('Cache-Control') or '')
+        return float(match.group(1)) if match else None
+
+    @property
+    def ttl(self):
+        # RSS <ttl> 以分鐘為單位
+        try:
+            return float(self.feed.feed.ttl) * 60 if self.feed is not None and self.feed.feed.get('ttl') else None
+        except (TypeError, ValueError):
+            return None
+
+
+def _feedparser():
+    # feedparser 載入很慢 (sgmllib / 大量編碼表)，延遲到第一次解析時才載入；
+    # 通常是在 worker thread / process 中，不會卡住啟動或 event loop
+    import feedparser
+    return feedparser
+
+def _parse_feed_bytes(body, content_type, content_location):
+    # 在 worker 中執行，必須是模組層級的函式才能被 process pool pickle
+    response_headers = {}
+    if content_type:
+        response_headers['content-type'] = content_type
+    if content_location:
+        response_headers['content-location'] = content_location
+    feed = _feedparser().parse(body, response_headers=response_headers)
+    if feed.get('bozo_exception') is not None:
+        # 格式有問題的 (bozo) feed 仍然可以使用，但 SAXParseException 之類的例外無法從 process pool 送回，
+        # 只保留文字描述
+        feed['bozo_exception'] = repr(feed['bozo_exception'])
+    return feed
+
+
+class FeedFetcher:
+    def __init__(self, timeout=30, max_connections=10, parse_workers=2,
+                 use_process_pool=False, user_agent=None):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.parse_workers = parse_workers
+        self.use_process_pool = use_process_pool
+        self.user_agent = user_agent or DEFAULT_USER_AGENT
+        self._session = None
+        self._executor = None
+
+    # --- Session / executor 的生命週期 ---
+    async def _ensure_session(self):
+        # session 必須在 event loop 內建立，所以延遲到第一次抓取時才建立
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def _ensure_executor(self):
+        if self._executor is None:
+            if self.use_process_pool:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.parse_workers, thread_name_prefix='feed-parse')
+        return self._executor
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # --- 解析 ---
+    async def parse(self, body, content_type=None, content_location=None):
+        """在 worker thread/process 中用 feedparser 解析已下載的 bytes"""
+        loop = asyncio.get_running_loop()
+        func = functools.partial(_parse_feed_bytes, body, content_type, content_location)
+        return await loop.run_in_executor(self._ensure_executor(), func)
+
+    # --- 抓取 ---
+    async def fetch(self, url, agent=None, etag=None, last_modified=None):
+        """下載並解析 feed。網路錯誤或逾時不會拋出，而是回傳 ok 為 False 的 FetchResult。
+        有提供 etag / last_modified 時送出 conditional GET，伺服器回 304 則不解析"""
+        session = await self._ensure_session()
+        headers = {'User-Agent': agent or self.user_agent}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        started = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as response:
+                body = await response.read()
+                status = response.status
+                response_headers = response.headers.copy()  # 保留大小寫不敏感的 CIMultiDict
+        except asyncio.TimeoutError as e:
+            print(f"[{datetime.datetime.now()}] Timeout ({self.timeout}s) while fetching {url}")
+            return FetchResult(url, error=e, fetch_time=time.perf_counter() - started)
+        except aiohttp.ClientError as e:
+            print(f"[{datetime.datetime.now()}] HTTP client error while fetching {url}: {e}")
+            return FetchResult(url, error=e, fetch_time=time.perf_counter() - started)
+        fetch_time = time.perf_counter() - started
+
+        if status == 304:
+            # 內容沒有變化，不需要解析
+            return FetchResult(url, status=status, headers=response_headers, body_size=len(body),
+                               fetch_time=fetch_time)
+
+        if status >= 400:
+            print(f"HTTP {status} while fetching {url}")
+            return FetchResult(url, status=status, headers=response_headers,
+                               body_size=len(body), error=f"HTTP {status}", fetch_time=fetch_time)
+
+        started = time.perf_counter()
+        try:
+            feed = await self.parse(body, response_headers.get('Content-Type'), url)
+        except Exception as e:
+            print(f"Error parsing feed from {url}: {e}")
+            return FetchResult(url, status=status, headers=response_headers,
+                               body_size=len(body), error=e, fetch_time=fetch_time)
+
+        return FetchResult(url, status=status, feed=feed, headers=response_headers,
+                           body_size=len(body), fetch_time=fetch_time,
+                           parse_time=time.perf_counter() - started)
+
+# --- END OF FILE feed_fetcher.py ---
@@ -0,0 +1,268 @@
+# --- START OF FILE feed_sources.py ---
+# Feed 來源註冊表：
+#   每一種來源 (YouTube / Instagram / Twitter via rss.app) 是一個 handler，
+#   負責「如何取得 entry ID」與「如何把 entry 變成 embed」。
+#   FeedSource 則代表一個實際要輪詢的 feed (URL + 狀態檔 + 輪詢間隔)。
+
+import os
+
+import discord
+
+from content_extract import extract_content
+from entry_utils import clean_html, truncate_text
+from timestamps import get_timestamp_from_entry
+
+
+# --- Handler 註冊表 ---
+SOURCE_HANDLERS = {}
+
+def register_source(handler_cls):
+    """Class decorator：把 handler 以 kind 註冊到 SOURCE_HANDLERS"""
+    SOURCE_HANDLERS[handler_cls.kind] = handler_cls()
+    return handler_cls
+
+def get_handler(kind):
+    try:
+        return SOURCE_HANDLERS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown feed source kind: {kind}") from None
+
+
+class SourceHandler:
+    kind = None
+    display_name = None
+    id_key = 'entry_id'          # 存在 *_latest.json 裡的 key
+    channel_config_key = None    # config 裡對應的頻道名稱 key
+    channel_ids_config_key = None  # config 裡對應的頻道 ID 清單 key (優先於名稱)
+    agent = None                 # 需要偽裝瀏覽器時設定 User-Agent
+    dedup_by_text = True         # 跨 feed 比對重複內容時是否也比對內文指紋
+
+    def entry_id(self, entry):
+        return entry.get('link') or None
+
+    def build_embed(self, source, feed, entry):
+        raise NotImplementedError
+
+
+# --- YouTube ---
+@register_source
+class YouTubeHandler(SourceHandler):
+    kind = 'youtube'
+    display_name = 'YouTube'
+    id_key = 'video_id'
+    channel_config_key = 'youtube_channel_name'
+    channel_ids_config_key = 'youtube_channel_ids'
+    dedup_by_text = False        # 影片說明多半是頻道固定的樣板文字，只以影片 URL 比對
+
+    def entry_id(self, entry):
+        video_id = entry.get('yt_videoid') # yt:videoId 通常是最好的 ID
+        if not video_id and entry.get('link'):
+             try: video_id = entry.link.split('v=')[1].split('&')[0]
+             except IndexError: video_id = entry.link # 備用連結
+        return video_id or None
+
+    def build_embed(self, source, feed, entry):
+        link = entry.link
+        timestamp_dt = get_timestamp_from_entry(entry, source.key)
+        title = entry.title if hasattr(entry, 'title') else "無標題影片"
+        summary = clean_html(entry.summary) if hasattr(entry, 'summary') else "無描述"
+
+        embed = discord.Embed(
+            title=f"[YouTube 更新] {title}",
+            url=link,
+            color=0xFF0000,
+            description=truncate_text(summary, 500), # 截斷描述
+            timestamp=timestamp_dt
+        )
+
+        author_name = entry.author if hasattr(entry, 'author') else (feed.feed.title if hasattr(feed.feed, 'title') else 'YouTube Channel')
+        author_icon = feed.feed.image.href if hasattr(feed.feed, 'image') and hasattr(feed.feed.image, 'href') else None
+        embed.set_author(name=author_name, icon_url=author_icon)
+
+        thumb_url = None
+        if hasattr(entry, 'media_thumbnail') and entry.media_thumbnail:
+            thumb_url = entry.media_thumbnail[0]['url']
+        elif hasattr(entry, 'get') and entry.get('media_thumbnail'):
+             thumb_url = entry.get('media_thumbnail')[0].get('url')
+        if thumb_url:
+            embed.set_image(url=thumb_url)
+
+        embed.set_footer(text="YouTube 更新通知")
+        return embed
+
+
+# --- Instagram (rss.app) ---
+@register_source
+class InstagramHandler(SourceHandler):
+    kind = 'instagram'
+    display_name = 'Instagram'
+    id_key = 'post_id'
+    channel_config_key = 'instagram_channel_name'
+    channel_ids_config_key = 'instagram_channel_ids'
+    agent = 'Mozilla/5.0' # 模擬瀏覽器
+
+    def build_embed(self, source, feed, entry):
+        link = entry.link
+        timestamp_dt = get_timestamp_from_entry(entry, source.key)
+        # Instagram 的 title 和 description 可能混亂，優先用 summary
+        content = entry.summary if hasattr(entry, 'summary') else (entry.title if hasattr(entry, 'title') else "")
+        # 文字與圖片從同一次解析取得
+        extracted = extract_content(content)
+        cleaned_content = extracted.text
+
+        embed = discord.Embed(
+            title="[Instagram 更新]",
+            url=link,
+            color=0xE1306C,
+            description=truncate_text(cleaned_content, 300), # 截斷內文
+            timestamp=timestamp_dt
+        )
+
+        # 作者通常是 entry author 或 feed title
+        author_name = entry.author if hasattr(entry, 'author') else (feed.feed.title if hasattr(feed.feed, 'title') else 'Instagram')
+        # 嘗試從 feed title 提取帳號名（如果有的話）
+        if 'Instagram feed for @' in author_name:
+             author_name = author_name.split('@')[1].strip()
+        embed.set_author(name=author_name)
+
+        image_url = None
+        # 嘗試從 enclosures 找圖片
+        if hasattr(entry, 'enclosures') and entry.enclosures:
+            for enc in entry.enclosures:
+                if enc.get('type', '').startswith('image/'):
+                    image_url = enc.href
+                    break
+        # 如果 enclosures 沒有，使用 summary/content HTML 中的第一個 img 標籤
+        if not image_url:
+            image_url = extracted.image_url
+
+        if image_url:
+            embed.set_image(url=image_url)
+
+        embed.set_footer(text="Instagram 更新通知")
+        return embed
+
+
+# --- Twitter (rss.app) ---
+@register_source
+class TwitterHandler(SourceHandler):
+    kind = 'twitter'
+    display_name = 'Twitter'
+    id_key = 'tweet_id'
+    channel_config_key = 'twitter_channel_name'
+    channel_ids_config_key = 'twitter_channel_ids'
+    agent = 'Mozilla/5.0'
+
+    def build_embed(self, source, feed, entry):
+        link = entry.link
+        timestamp_dt = get_timestamp_from_entry(entry, source.key)
+        # 推文內容通常在 title
+        content = entry.title if hasattr(entry, 'title') else ""
+        cleaned_content = clean_html(content) # 清理 HTML 實體等
+
+        embed = discord.Embed(
+            title="[Twitter 更新]",
+            url=link,
+            color=0x1DA1F2,
+            description=truncate_text(cleaned_content, 300), # 截斷內文
+            timestamp=timestamp_dt
+        )
+
+        # 作者名通常在 entry.author
+        author_name = entry.author if hasattr(entry, 'author') else source.label
+        # 嘗試移除可能的前綴如 "(@username)"
+        if author_name.startswith("(") and author_name.endswith(")"):
+             author_name = author_name[1:-1]
+        embed.set_author(name=author_name)
+
+        image_url = None
+        # 優先從 media_content (rss.app 常用)
+        if hasattr(entry, 'media_content') and entry.media_content:
+             for media in entry.media_content:
+                 if media.get('medium') == 'image' and media.get('url'):
+                     image_url = media['url']
+                     break
+        # 其次嘗試 enclosures
+        if not image_url and hasattr(entry, 'enclosures') and entry.enclosures:
+             for enc in entry.enclosures:
+                 if enc.get('type', '').startswith('image/'):
+                     image_url = enc.href
+                     break
+        # 最後嘗試從 summary/content HTML 解析 (效果可能不佳)
+        if not image_url and hasattr(entry, 'summary'):
+            image_url = extract_content(entry.summary).image_url
+
+        if image_url:
+            embed.set_image(url=image_url)
+
+        embed.set_footer(text="Twitter 更新通知")
+        return embed
+
+
+# --- 實際要輪詢的 feed ---
+class FeedSource:
+    def __init__(self, key, kind, url, state_path, interval, label=None, channel_ids=None):
+        self.key = key                # 唯一識別 (同時是狀態檔名的基礎)
+        self.kind = kind
+        self.url = url
+        self.state_path = state_path
+        self.interval = interval      # 這個 feed 自己的輪詢間隔 (秒)
+        self.label = label or key     # 用於日誌
+        self.channel_ids = channel_ids  # 這個 feed 專屬的目標頻道 ID；None 表示沿用同類來源的設定
+        self.min_interval = None      # 輪詢間隔的下限 (例如有 WebSub 推播時輪詢只作為備援)
+
+    @property
+    def handler(self):
+        return get_handler(self.kind)
+
+    def __repr__(self):
+        return f"<FeedSource {self.kind}:{self.label} {self.url}>"
+
+
+# --- 自動產生 Twitter 檔案路徑 ---
+# 假設 rss.app 的 URL 包含帳號名或唯一標識
+# 注意：如果 URL 格式變化，這裡的檔名提取邏輯可能需要調整
+def get_account_name_from_rss(url):
+    try:
+        # 嘗試從 URL 中提取一個有意義的部分作為檔名基礎
+        # 這是一個基於 rss.app 常見格式的猜測
+        name_part = url.split('/')[-1].split('.')[0]
+        # 移除可能的隨機字符串 (如果有的話)
+        # 這裡只是簡單示例，可能需要更複雜的邏輯
+        if len(name_part) > 15: # 假設過長的是隨機碼
+             name_part = name_part[:10] # 取前10個字符
+        return name_part if name_part else "unknown_twitter"
+    except Exception:
+        return "unknown_twitter"
+
+def _feed_entry(value, default_interval):
+    # config 裡的 feed 可以是 URL 字串，也可以是 {'url': ..., 'interval': ..., 'channel_ids': [...]}
+    if isinstance(value, dict):
+        return value['url'], value.get('interval') or default_interval, value.get('channel_ids')
+    return value, default_interval, None
+
+def build_feed_sources(config):
+    """根據 config 建立所有 FeedSource。狀態檔名沿用舊版的 *_latest.json，確保既有狀態不會遺失"""
+    data_folder = config['data_folder']
+    default_interval = config['check_interval']
+    sources = []
+
+    if config.get('youtube_rss'):
+        url, interval, channel_ids = _feed_entry(config['youtube_rss'], default_interval)
+        sources.append(FeedSource('youtube', 'youtube', url,
+                                  os.path.join(data_folder, 'youtube_latest.json'), interval,
+                                  channel_ids=channel_ids))
+    if config.get('instagram_rss'):
+        url, interval, channel_ids = _feed_entry(config['instagram_rss'], default_interval)
+        sources.append(FeedSource('instagram', 'instagram', url,
+                                  os.path.join(data_folder, 'instagram_latest.json'), interval,
+                                  channel_ids=channel_ids))
+    for value in config.get('twitter_rss', []):
+        url, interval, channel_ids = _feed_entry(value, default_interval)
+        account_name = get_account_name_from_rss(url)
+        sources.append(FeedSource(f"twitter:{account_name}", 'twitter', url,
+                                  os.path.join(data_folder, f"{account_name}_latest.json"),
+                                  interval, label=account_name, channel_ids=channel_ids))
+    return sources
+
+# --- END OF FILE feed_sources.py ---
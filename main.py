@@ -1,25 +1,34 @@
 # --- START OF FILE main.py ---
 
 import discord
-import feedparser
 import os
-import json
-import time
+import asyncio
+import collections
+import contextlib
 import datetime
+import time
 from dotenv import load_dotenv
-from discord.ext import tasks, commands
-# Optional but recommended imports for better parsing
-try:
-    from dateutil import parser as dateutil_parser
-except ImportError:
-    dateutil_parser = None
-    print("Warning: 'python-dateutil' not installed. Timestamp parsing might be less reliable. Run: pip install python-dateutil")
-try:
-    from bs4 import BeautifulSoup
-except ImportError:
-    BeautifulSoup = None
-    print("Warning: 'beautifulsoup4' not installed. HTML content cleaning disabled. Run: pip install beautifulsoup4")
-
+from discord.ext import commands
+from feed_fetcher import FeedFetcher
+from feed_sources import build_feed_sources
+from feed_config import FEED_CONFIG_KEYS, FeedConfigWatcher, diff_sources, load_feed_config
+from poll_scheduler import AdaptivePolicy, PollOutcome, PollScheduler
+from channel_router import ChannelRouter
+from delivery import COALESCED, DELIVERED_RESULTS, DUPLICATE, FAILED, FINAL_RESULTS, SENT, DeliveryQueue
+from catchup import PendingEntry, merge_chronological, plan_channel
+from dedup import DedupIndex, entry_keys
+from webhooks import WebhookRegistry
+from render_cache import RenderCache
+from metrics import Metrics
+from timestamps import entry_epoch
+from seen_entries import bootstrap_seen, find_new_entries
+from state_store import StateStore
+from sharding import ShardPool, WorkerLost
+from websub import DEFAULT_HUB_URL, WebSubSubscriber, youtube_topic_for
+
+
+# 啟動計時的起點 (各階段的耗時見 startup_phase)
+startup_started = time.monotonic()
 
 load_dotenv()
 
@@ -29,8 +38,89 @@ config = {
     # 強烈建議從 .env 文件或環境變數讀取 Token
     'token': os.getenv('DISCORD_TOKEN') or 'MTM1ODI3NjQ4MzY3NTU4NjYzMQ.G81GbP.Sl3Tv2f0Ray3sKiav8JNyvDd_moDDR26k9Lrn4',
     'prefix': '!', # 機器人指令前綴 (如果有的話)
-    'check_interval': 5 * 60,  # 檢查間隔 (秒), 這裡設為 5 分鐘
+    'check_interval': 5 * 60,  # 檢查間隔 (秒), 這裡設為 5 分鐘 (個別 feed 可用 {'url': ..., 'interval': ...} 覆蓋)
+    'max_concurrent_polls': 5, # 同時進行輪詢的 feed 數量上限
+    'poll_jitter': 0.1,        # 輪詢間隔的隨機浮動比例 (0.1 = ±10%)
+    'seen_capacity': 500,      # 每個 feed 記住多少個已通知的 entry ID
+    # 依發文頻率自動調整每個 feed 的輪詢間隔 (活躍的 feed 更頻繁，閒置/錯誤/429 時退避)
+    'adaptive_polling': True,
+    'min_poll_interval': 60,
+    'max_poll_interval': 60 * 60,
     'data_folder': 'data', # 儲存最新 ID 的資料夾
+    'state_db': os.path.join('data', 'state.db'), # 所有 feed 狀態的 SQLite 資料庫
+    'state_flush_delay': 1.0,  # 狀態變更延遲多少秒批次寫入
+
+    'render_cache_size': 512,  # 快取多少個已渲染的 embed (重試/多頻道/下次輪詢可直接重用)
+
+    # 跨 feed 的重複內容合併：同一則內容 (相同的 canonical URL 或內文) 在時間窗內只通知每個頻道一次
+    'dedup_enabled': True,
+    'dedup_window': 6 * 60 * 60,    # 秒
+    'dedup_min_text_length': 20,    # 內文少於這個字數時不比對內文 (只比對 URL)
+
+    # --- Discord 發送設定 ---
+    # 'bot': 用 bot 帳號 channel.send；'webhook': 每個頻道建立 webhook 發送
+    # (webhook 模式需要「管理 Webhook」權限，不佔用 bot 的 rate-limit，連續多則更新可合併成一次請求)
+    'delivery_mode': 'bot',
+    'delivery_workers': 4,          # 同時發送訊息的 worker 數量
+    'delivery_max_retries': 4,      # 429 / 5xx 時最多重試幾次
+    # webhook 模式下，新的更新等待幾秒再發送，讓同時更新的其他 feed (YouTube / Instagram / Twitter) 合併成同一次請求
+    'delivery_coalesce_delay': 1.0,
+    'channel_rate_limit': (5, 5.0), # 單一頻道: 每 5 秒最多 5 則
+    'global_rate_limit': (40, 1.0), # 全域: 每秒最多 40 則
+
+    # --- Feed 抓取設定 ---
+    'fetch_timeout': 30,          # 每個 feed 請求的逾時 (秒)
+    'fetch_max_connections': 10,  # HTTP 連線池大小 (keep-alive)
+    'parse_workers': 2,           # 解析 feed 的 worker 數量
+    'parse_in_process': False,    # True: 用 process pool 解析 (多核心); False: 用 thread pool
+
+    # --- 多程序分片 ---
+    # 大於 0 時啟動這麼多個 worker 程序，依一致性雜湊分配 feed，
+    # 下載 / 解析 / HTML 清理 / embed 渲染都在 worker 進行 (可以用到多個 CPU 核心)；
+    # 新 entry 判斷與發送仍在這個程序，worker 增減不會遺失或重複通知
+    'shard_workers': 0,
+    'shard_restart_workers': True,  # worker 意外結束時自動重新啟動
+
+    # --- 停機 / 斷線後的補發 ---
+    # 啟動時 (以及 gateway 斷線太久後重新連線時) 一次抓取所有 feed，錯過的 entry 依時間順序補發
+    'catchup_enabled': True,
+    'catchup_min_downtime': 60,         # 斷線超過多少秒，重新連線後才補發
+    'catchup_max_age': 24 * 60 * 60,    # 沒有 seen set 的 feed 最多補發多久以前發佈的 entry (秒)
+    'catchup_digest_threshold': 5,      # 單一頻道錯過超過這個數量時改用摘要 embed (0 = 一律逐則發送)
+    'catchup_digest_size': 10,          # 每個摘要 embed 最多列出幾則
+
+    # 啟動時把每個 feed 的第一次輪詢平均分散在它的間隔內，而不是所有 feed 同時抓取
+    'stagger_first_polls': True,
+
+    # --- Metrics ---
+    # 啟用後在 metrics_host:metrics_port/metrics 提供 Prometheus 格式的指標，
+    # 並每 metrics_log_interval 秒印出一行 JSON 摘要 (0 表示不印)
+    'metrics_enabled': False,
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 9108,
+    'metrics_log_interval': 5 * 60,
+
+    # --- YouTube WebSub 推播 ---
+    # 啟用後向 hub 訂閱 YouTube 頻道，新影片幾秒內就會推送到 bot 內建的 callback 伺服器；
+    # 輪詢只作為備援，間隔放寬到 websub_fallback_interval。
+    # websub_callback_url 必須是 hub 從外部連得到、對應到 listen_host:listen_port 的 URL
+    'websub_enabled': False,
+    'websub_callback_url': os.getenv('WEBSUB_CALLBACK_URL'),  # 例如 https://example.com/websub
+    'websub_listen_host': '0.0.0.0',
+    'websub_listen_port': 8080,
+    'websub_path': '/websub',
+    'websub_hub_url': DEFAULT_HUB_URL,   # 可改成本機的替代 hub 來測試
+    'websub_secret': os.getenv('WEBSUB_SECRET'),  # 驗證推播簽章 (HMAC)；未設定時每次啟動隨機產生
+    'websub_lease_seconds': 5 * 24 * 60 * 60,
+    'websub_fallback_interval': 60 * 60,  # 推播啟用時 YouTube 的備援輪詢間隔下限 (秒)
+    'websub_max_entry_age': 24 * 60 * 60, # 推播中發佈超過這個時間的 entry (舊影片被編輯) 不通知
+    'websub_refetch_delays': (60, 300),   # 推播的影片還沒出現在 RSS 時，隔多少秒再抓一次
+
+    # --- 外部 feed 設定檔 (可熱重載) ---
+    # 檔案存在時，其中的 feed URL / 頻道設定會覆蓋下面的同名項目；
+    # 執行中修改檔案會自動套用，只影響有變化的 feed (格式見 feed_config.py)
+    'feeds_file': 'feeds.json',
+    'feeds_file_check_interval': 10,  # 檢查檔案是否變更的間隔 (秒)
 
     # --- RSS Feed URLs ---
     # !! 請確認這些 URL 是最新且有效的 !!
@@ -41,144 +131,64 @@ config = {
         'https://rss.app/feeds/STiwPfYu6UYxh02f.xml'   # Twitter 帳號 2 RSS (WE_NMIXX)
     ],
 
-    # --- Discord 頻道名稱 ---
+    # --- Discord 頻道 ---
+    # 建議用頻道 ID 指定 (右鍵頻道 → 複製頻道 ID)，比名稱穩定
+    # 清單為空時才會退回用下面的頻道名稱比對
+    'youtube_channel_ids': [],
+    'instagram_channel_ids': [],
+    'twitter_channel_ids': [],
     # !! 請確認這些名稱與你伺服器中的頻道名稱一致 !!
-    # 建議未來改用頻道 ID 會更穩定
     'youtube_channel_name': 'sns更新（已開發3∕4）',
     'instagram_channel_name': 'sns更新（已開發3∕4）',
     'twitter_channel_name': 'sns更新（已開發3∕4）',
 }
 
-# --- 自動產生 Twitter 檔案路徑 ---
-# 假設 rss.app 的 URL 包含帳號名或唯一標識
-# 注意：如果 URL 格式變化，這裡的檔名提取邏輯可能需要調整
-def get_account_name_from_rss(url):
-    try:
-        # 嘗試從 URL 中提取一個有意義的部分作為檔名基礎
-        # 這是一個基於 rss.app 常見格式的猜測
-        name_part = url.split('/')[-1].split('.')[0]
-        # 移除可能的隨機字符串 (如果有的話)
-        # 這裡只是簡單示例，可能需要更複雜的邏輯
-        if len(name_part) > 15: # 假設過長的是隨機碼
-             name_part = name_part[:10] # 取前10個字符
-        return name_part if name_part else "unknown_twitter"
-    except Exception:
-        return "unknown_twitter"
-
-twitter_latest_paths = [
-    os.path.join(config['data_folder'], f"{get_account_name_from_rss(url)}_latest.json")
-    for url in config['twitter_rss']
-]
-
-# 確保數據文件夾存在
-if not os.path.exists(config['data_folder']):
-    os.makedirs(config['data_folder'])
-    print(f"Created data folder: {config['data_folder']}")
-
-# 儲存最後更新狀態的檔案路徑
-youtube_latest_path = os.path.join(config['data_folder'], 'youtube_latest.json')
-instagram_latest_path = os.path.join(config['data_folder'], 'instagram_latest.json')
-
-
-# --- Helper function to safely load last notified ID ---
-def load_last_id(filepath, key_name):
-    last_notified = {key_name: ''}
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read().strip() # 讀取並移除前後空白
-                if content: # 確保文件不是空的
-                    last_notified = json.loads(content)
-                # 確保 key 存在，且值不是 None (處理舊格式或損壞)
-                if key_name not in last_notified or last_notified[key_name] is None:
-                    last_notified[key_name] = ''
-        except json.JSONDecodeError:
-            print(f'Warning: Corrupted or empty JSON file: {filepath}. Starting fresh.')
-            last_notified = {key_name: ''}
-        except Exception as e:
-            print(f'Error reading latest file {filepath}: {e}')
-            last_notified = {key_name: ''}
-    return last_notified
-
-# --- Helper function to safely save last notified ID ---
-def save_last_id(filepath, key_name, value):
-    # 確保 ID 值是有效的字串
-    if not isinstance(value, str) or not value:
-         print(f"Warning: Attempted to save invalid ID (value: {value}) to {filepath}. Skipping save.")
-         return
-    try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump({key_name: value}, f, ensure_ascii=False, indent=4)
-        print(f"Successfully updated {filepath} with ID: {value}")
-    except Exception as e:
-        print(f"CRITICAL: Failed to write latest ID to {filepath}: {e}")
-
-
-# --- Helper function to parse timestamp ---
-def get_timestamp_from_entry(entry):
-    """從 feed entry 獲取 datetime 對象，處理可能的錯誤"""
-    dt = None
-    # 優先使用 feedparser 解析好的 time struct
-    if hasattr(entry, 'published_parsed') and entry.published_parsed:
-        try:
-            # 轉換為 timezone-aware 的 datetime (UTC)
-            dt = datetime.datetime.fromtimestamp(time.mktime(entry.published_parsed), tz=datetime.timezone.utc)
-        except (TypeError, ValueError, OverflowError) as e:
-             print(f"Could not convert published_parsed {entry.published_parsed} to timestamp: {e}")
-             dt = None # 轉換失敗，嘗試下一個方法
-
-    # 如果 published_parsed 失敗或不存在，嘗試解析 published 字串
-    if dt is None and hasattr(entry, 'published') and entry.published:
-        if dateutil_parser:
-            try:
-                dt = dateutil_parser.parse(entry.published)
-                # 如果解析出來沒有時區信息，假設它是 UTC
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=datetime.timezone.utc)
-            except Exception as e:
-                print(f"Could not parse timestamp string using dateutil: {entry.published} - Error: {e}")
-                dt = None # 解析失敗
-        else:
-             # 沒有 dateutil，可以嘗試 feedparser 內建的簡單解析 (效果有限)
-             try:
-                 # feedparser._parse_date Может вернуть None или time.struct_time
-                 parsed_date = feedparser.parse(entry.published) # Hacky way, maybe not reliable
-                 if parsed_date and parsed_date.entries and hasattr(parsed_date.entries[0], 'published_parsed'):
-                     struct_time = parsed_date.entries[0].published_parsed
-                     dt = datetime.datetime.fromtimestamp(time.mktime(struct_time), tz=datetime.timezone.utc)
-             except Exception:
-                  dt = None
-
-    # 如果所有方法都失敗，返回當前 UTC 時間
-    if dt is None:
-        print(f"Warning: Using current time as timestamp for entry: {entry.get('title', 'N/A')}")
-        dt = discord.utils.utcnow()
-
-    return dt
-
-# --- Helper function to clean HTML ---
-def clean_html(raw_html):
-    if BeautifulSoup and raw_html:
-        try:
-            soup = BeautifulSoup(raw_html, 'html.parser')
-            text = soup.get_text(separator=' ', strip=True)
-            return text
-        except Exception as e:
-            print(f"Error cleaning HTML: {e}")
-            return raw_html # 清理失敗返回原始文本
-    return raw_html if raw_html else "" # 沒有 BeautifulSoup 或輸入為空
-
-# --- Helper function to truncate text ---
-def truncate_text(text, max_length):
-    if not text: return ""
-    if len(text) <= max_length:
-        return text
-    # 嘗試在最後一個空格處截斷
-    truncated = text[:max_length].rsplit(' ', 1)[0]
-    # 如果截斷後太短（比如第一句很長），就直接截斷
-    if len(truncated) < max_length * 0.8:
-         truncated = text[:max_length]
-    return truncated + " ..."
+
+# config 內建的 feed 設定；feed 設定檔移除某個項目時會回到這裡的值
+base_feed_config = {key: config.get(key) for key in FEED_CONFIG_KEYS}
+try:
+    config.update(load_feed_config(config['feeds_file']))
+except (OSError, ValueError) as e:
+    print(f"Error loading feed config, using the built-in feeds: {e}")
+
+def source_route(source):
+    """一個 feed 要送到的 (頻道 ID 清單, 頻道名稱)；頻道 ID 不是數字時拋出 ValueError"""
+    handler = source.handler
+    channel_ids = source.channel_ids if source.channel_ids is not None else config.get(handler.channel_ids_config_key)
+    return [int(channel_id) for channel_id in channel_ids or ()], config[handler.channel_config_key]
+
+def build_feeds():
+    """依目前的 config 建立所有 FeedSource 與各自的路由；任何一個錯誤都會在套用之前拋出"""
+    sources = build_feed_sources(config)
+    return sources, {source.key: source_route(source) for source in sources}
+
+# 所有要輪詢的 feed (YouTube / Instagram / Twitter)
+try:
+    feed_sources, feed_routes = build_feeds()
+except (KeyError, TypeError, ValueError) as e:
+    print(f"Invalid feed config, using the built-in feeds: {e}")
+    config.update(base_feed_config)
+    feed_sources, feed_routes = build_feeds()
+
+# 抓取 / 解析 / 渲染 / 發送各階段的指標 (停用時所有記錄都是 no-op)
+metrics = Metrics(enabled=config['metrics_enabled'])
+
+startup_phases = {}
+
+def startup_phase(name):
+    """記錄啟動到某個階段花了多少秒 (每個階段只記錄第一次)"""
+    if name in startup_phases:
+        return
+    elapsed = startup_phases[name] = time.monotonic() - startup_started
+    metrics.set_gauge('startup_seconds', elapsed, phase=name)
+    print(f"Startup: {name} after {elapsed:.2f}s")
+
+# 所有 feed 的狀態 (last ID / seen set / validators / 發送記錄) 存在同一個 SQLite 資料庫，
+# 在登入之前一次讀進記憶體 (資料夾由 StateStore 需要時才建立)
+state_store = StateStore(config['state_db'], seen_capacity=config['seen_capacity']).open()
+state_store.migrate_legacy_json(feed_sources)
+state_store.load()
+startup_phase('state_loaded')
 
 
 # --- 建立 Discord 客戶端 ---
@@ -187,297 +197,591 @@ intents.message_content = False # 除非你需要讀取用戶指令內容，否
 intents.members = False         # 除非你需要成員加入/離開事件或精確的成員列表
 intents.guilds = True           # 需要知道機器人在哪些伺服器
 
-client = commands.Bot(command_prefix=config['prefix'], intents=intents)
-
-# --- 檢查 YouTube 更新 ---
-@tasks.loop(seconds=config['check_interval'])
-async def check_youtube_updates():
-    print(f"[{datetime.datetime.now()}] Checking YouTube updates...")
+# 共用的非同步 feed 抓取器 (連線池 + 背景解析)
+fetcher = FeedFetcher(
+    timeout=config['fetch_timeout'],
+    max_connections=config['fetch_max_connections'],
+    parse_workers=config['parse_workers'],
+    use_process_pool=config['parse_in_process'],
+)
+
+class FeedBot(commands.Bot):
+    async def setup_hook(self):
+        # 已經登入、gateway 還在連線：先開始抓取所有 feed，網路等待與 gateway 握手同時進行
+        global startup_fetch
+        startup_phase('logged_in')
+        await metrics.start(config['metrics_host'], config['metrics_port'], config['metrics_log_interval'])
+        if shard_pool is not None:
+            await shard_pool.start()
+        if config['catchup_enabled']:
+            startup_fetch = asyncio.create_task(fetch_all(list(feed_sources)), name='startup-fetch')
+
+    async def close(self):
+        # 關閉 Bot 時一併停止排程器並釋放 HTTP session 與解析用的 worker
+        await feed_config_watcher.stop()
+        for task in (startup_fetch, catch_up_task):
+            if task is not None:
+                task.cancel()
+        await scheduler.stop()
+        if shard_pool is not None:
+            await shard_pool.stop()
+        await metrics.stop()
+        if websub is not None:
+            await websub.stop()
+        await delivery_queue.stop()
+        if webhook_registry is not None:
+            await webhook_registry.close()
+        await fetcher.close()
+        await state_store.aclose()
+        await super().close()
+
+client = FeedBot(command_prefix=config['prefix'], intents=intents)
+
+# 已渲染的 embed 快取 (key: feed + entry ID，內容 hash 改變時失效)
+render_cache = RenderCache(config['render_cache_size'], metrics=metrics)
+
+# Webhook 模式下每個頻道的 webhook (bot 模式為 None)
+webhook_registry = WebhookRegistry(state_store) if config['delivery_mode'] == 'webhook' else None
+
+# 併發、會控制速率的發送佇列
+delivery_queue = DeliveryQueue(
+    state_store,
+    workers=config['delivery_workers'],
+    max_retries=config['delivery_max_retries'],
+    coalesce_delay=config['delivery_coalesce_delay'],
+    channel_rate=config['channel_rate_limit'],
+    global_rate=config['global_rate_limit'],
+    webhooks=webhook_registry,
+    metrics=metrics,
+)
+
+# Feed → 頻道的路由索引 (on_ready 時建立，之後由 guild/channel 事件增量更新)
+channel_router = ChannelRouter()
+
+def route_source(source, route):
+    channel_ids, channel_name = route
+    channel_router.set_route(source.key, channel_ids, channel_name)
+
+for source in feed_sources:
+    route_source(source, feed_routes[source.key])
+
+# 所有 feed 共用的重複內容索引
+dedup_index = DedupIndex(config['dedup_window']) if config['dedup_enabled'] else None
+
+def _entry_dedup_keys(source, entry):
+    return entry_keys(entry, config['dedup_min_text_length'], text=source.handler.dedup_by_text)
+
+# 同一個 feed 的輪詢與推播不能同時處理，否則同一則 entry 可能被通知兩次
+feed_locks = collections.defaultdict(asyncio.Lock)
+
+# --- 處理一份已解析的 feed：找出新 entry 並發送 (輪詢、WebSub 推播與補發共用) ---
+def collect_new_entries(source, feed, entries, entry_id_func=None, render=None, keys_func=None, since=None):
+    """找出 seen set 裡沒有的 entry 並渲染。回傳 ([PendingEntry, ...] 由舊到新, 新 entry 數量, 是否全部渲染成功)。
+    entry_id_func / render / keys_func 預設為 handler.entry_id、渲染快取與 entry_keys；
+    分片模式下改用 worker 送回的記錄。since 為補發時的起點 (epoch 秒)，只用於還沒有 seen set 的 feed"""
+    handler = source.handler
+    name = handler.display_name
+    state = state_store.get(source.key)
+    entry_id_func = entry_id_func or handler.entry_id
+    render = render or (lambda entry_id, entry: render_cache.get_or_render(source, feed, entry_id, entry))
+    keys_func = keys_func or (lambda entry: _entry_dedup_keys(source, entry))
+
+    if not state.seen_initialized:
+        # 舊版狀態只有 last_id (或完全沒有狀態)：以目前的 feed 建立 seen set
+        bootstrap_seen(entries, entry_id_func, state.seen, state.last_id, since=since)
+        state.seen_initialized = True
+        for entry in entries:
+            if entry_id_func(entry) in state.seen:
+                state.advance_high_water(entry_epoch(entry))
+        state_store.mark_dirty(source.key)
+
+    new_entries = find_new_entries(entries, entry_id_func, state.seen)
+    metrics.inc('feed_entries_processed_total', len(entries), feed=source.key)
+    if new_entries:
+        metrics.inc('feed_new_entries_total', len(new_entries), feed=source.key)
+        oldest = entry_epoch(new_entries[0][1])
+        if len(new_entries) >= len(entries) and state.high_water is not None and oldest is not None and oldest > state.high_water:
+            # feed 裡每一則都是新的，而且最舊的一則仍晚於上次處理到的位置：中間可能有 entry 已經不在 feed 裡了
+            print(f"Warning: every entry in {name} feed {source.label} is new. "
+                  f"Updates published between the last processed entry and {datetime.datetime.fromtimestamp(oldest)} may have been missed.")
+    all_rendered = True
+    pending = []
+    for entry_id, entry in new_entries:
+        print(f"檢測到新的 {name} 更新 from {source.label}: {entry.get('title', 'N/A')}")
+        embed = render(entry_id, entry)
+        if embed is None:
+            # worker 沒有渲染這則 entry (渲染失敗)：下一次輪詢再試
+            all_rendered = False
+            continue
+        keys = keys_func(entry) if dedup_index is not None else ()
+        pending.append(PendingEntry(source, entry_id, embed, entry_epoch(entry),
+                                    entry.get('title', ''), entry.get('link'), keys))
+    return pending, len(new_entries), all_rendered
+
+def claim_duplicates(source, pending, channels):
+    """在發送前 (同一個 event loop 步驟內) 向 dedup_index 認領，併發的其他 feed 看得到。
+    回傳 {channel_id: {entry_id, ...}}：這些頻道已經 (或正在) 收到同樣的內容"""
+    skip = {}
+    if dedup_index is None:
+        return skip
+    name = source.handler.display_name
+    channel_ids = [channel.id for channel in channels]
+    for item in pending:
+        duplicates = dedup_index.claim(source.key, item.entry_id, item.keys, channel_ids)
+        if duplicates:
+            metrics.inc('dedup_coalesced_total', len(duplicates), feed=source.key)
+        for channel_id, (other_key, other_id) in duplicates.items():
+            skip.setdefault(channel_id, set()).add(item.entry_id)
+            print(f"{name} update {item.entry_id} from {source.label} is the same content as {other_key} {other_id}. "
+                  f"Skipping channel {channel_id}.")
+    return skip
+
+def settle_entries(source, state, pending, results):
+    """依發送結果 ({entry_id: {channel_id: 結果}}) 更新 seen set / last ID / high-water mark；
+    回傳是否每則 entry 都已處理完畢"""
+    name = source.handler.display_name
+    all_delivered = True
+    for item in pending:
+        entry_results = results[item.entry_id]
+        if dedup_index is not None:
+            for channel_id, outcome in entry_results.items():
+                if outcome == FAILED:
+                    dedup_index.release(source.key, item.entry_id, item.keys, channel_id)
+        outcomes = entry_results.values()
+        if outcomes and all(outcome in FINAL_RESULTS for outcome in outcomes):
+            # 每個頻道都已送達 (或永久失敗)，這則 entry 處理完畢
+            state.seen.add(item.entry_id)
+            if any(outcome in DELIVERED_RESULTS for outcome in outcomes):
+                state.last_id = item.entry_id
+            state.advance_high_water(item.timestamp)
+            state_store.mark_dirty(source.key)
+        else:
+            # 沒有任何目標頻道，或部分頻道暫時失敗：不標記為已看過，下一次輪詢再試
+            # (已送達的頻道有發送記錄，重試時不會重複發送)
+            all_delivered = False
+            print(f"{name} notification for {source.label} ({item.entry_id}) was not delivered to every channel. Will retry next poll.")
+    return all_delivered
+
+def finish_feed(source, state, result, all_delivered):
+    # 只有在這次 poll 完整處理完畢後才更新 validators，否則下一次的 304 會讓失敗的通知永遠不再重試
+    if result is not None and all_delivered and (state.etag, state.last_modified) != (result.etag, result.last_modified):
+        state.set_validators(result)
+        state_store.mark_dirty(source.key)
+    state_store.schedule_flush(config['state_flush_delay'])
+
+async def process_feed(source, feed, entries, result=None, entry_id_func=None, render=None, keys_func=None):
+    """回傳新 entry 的數量。result 為輪詢的 FetchResult (推播時為 None)，用來在處理完畢後更新 validators"""
+    state = state_store.get(source.key)
+    pending, new_count, all_delivered = collect_new_entries(source, feed, entries, entry_id_func, render, keys_func)
+    if pending:
+        channels = channel_router.channels_for(source.key)
+        skip = claim_duplicates(source, pending, channels)
+        items = [(item.entry_id, item.embed) for item in pending]
+        results = await delivery_queue.deliver(source.key, items, channels,
+                                               label=f"{source.handler.display_name} {source.label}", skip=skip)
+        if any(SENT in outcomes.values() for outcomes in results.values()):
+            startup_phase('first_notification')
+        all_delivered = settle_entries(source, state, pending, results) and all_delivered
+    finish_feed(source, state, result, all_delivered)
+    return new_count
+
+# --- 檢查單一 feed 的更新 (所有來源共用) ---
+async def fetch_feed(source, state):
+    """抓取並解析一個 feed (分片模式下由 worker 進行)；worker 失敗時拋出 WorkerLost / RuntimeError"""
+    if shard_pool is not None:
+        result = await shard_pool.fetch(source, state)
+    else:
+        result = await fetcher.fetch(source.url, agent=source.handler.agent,
+                                     etag=state.etag, last_modified=state.last_modified)
+    metrics.inc('feed_fetch_total', feed=source.key, status=str(result.status or 'error'))
+    if result.fetch_time is not None:
+        metrics.observe('feed_fetch_seconds', result.fetch_time, feed=source.key)
+    if result.body_size:
+        metrics.inc('feed_fetch_bytes_total', result.body_size, feed=source.key)
+    if result.parse_time is not None:
+        metrics.observe('feed_parse_seconds', result.parse_time, feed=source.key)
+    return result
+
+async def poll_feed(source):
+    handler = source.handler
+    name = handler.display_name
+    print(f"[{datetime.datetime.now()}] Checking {name} feed: {source.label} via {source.url}")
+
+    state = state_store.get(source.key)
     try:
-        feed = feedparser.parse(config['youtube_rss'])
-        if not feed.entries:
-            print("YouTube feed empty or failed to load.")
-            return
-
-        latest_video = feed.entries[0]
-        video_id = latest_video.get('yt_videoid') # yt:videoId 通常是最好的 ID
-        if not video_id and latest_video.link:
-             try: video_id = latest_video.link.split('v=')[1].split('&')[0]
-             except IndexError: video_id = latest_video.link # 備用連結
-
-        if not video_id:
-            print("Could not extract a usable video ID from YouTube feed entry.")
+        result = await fetch_feed(source, state)
+    except (WorkerLost, RuntimeError) as e:
+        print(f"{name} feed {source.label} could not be polled by a worker: {e}")
+        return PollOutcome(error=True)
+    # 伺服器要求的最短間隔 (Retry-After / Cache-Control max-age / RSS ttl)
+    hints = [hint for hint in (result.retry_after, result.max_age, result.ttl) if hint]
+    min_delay = max(hints) if hints else None
+    if result.not_modified:
+        print(f"{name} feed {source.label} not modified (304).")
+        return PollOutcome(min_delay=min_delay)
+    feed = result.feed
+    if not result.entries:
+        print(f"{name} feed {source.label} empty or failed to load.")
+        return PollOutcome(error=not result.ok, rate_limited=result.rate_limited, min_delay=min_delay)
+
+    async with feed_locks[source.key]:
+        if state_store.get(source.key) is not state:
+            # 輪詢期間 feed 設定被重載、狀態已重設 (URL 換成別的 feed)：這次的結果作廢
+            return PollOutcome(min_delay=min_delay)
+        new_count = await process_feed(source, feed, feed.entries, result, **_record_options())
+
+    entry_times = [t for t in (entry_epoch(entry) for entry in feed.entries) if t is not None]
+    return PollOutcome(changed=bool(new_count), min_delay=min_delay, entry_times=entry_times)
+
+# --- 分片模式：worker 送回的是精簡過的記錄，embed 已經在 worker 渲染好 ---
+def _record_id(record):
+    return record['id']
+
+def _render_record(entry_id, record):
+    return discord.Embed.from_dict(record['embed']) if record.get('embed') else None
+
+def _record_dedup_keys(record):
+    return record.get('dedup_keys') or []
+
+def _record_options():
+    if shard_pool is None:
+        return {}
+    return {'entry_id_func': _record_id, 'render': _render_record, 'keys_func': _record_dedup_keys}
+
+shard_pool = None
+if config['shard_workers'] > 0:
+    shard_pool = ShardPool(
+        workers=config['shard_workers'],
+        fetch_options={
+            'timeout': config['fetch_timeout'],
+            'max_connections': config['fetch_max_connections'],
+            'parse_workers': 1,   # worker 本身就是獨立程序
+        },
+        dedup_min_text_length=config['dedup_min_text_length'],
+        restart=config['shard_restart_workers'],
+    )
+
+# --- WebSub 推播 (YouTube) ---
+async def on_websub_notification(source, feed):
+    """hub 推送的 Atom 沒有 media:group (沒有縮圖與描述)，所以推播只當作觸發：
+    立刻抓取完整的 RSS，走與輪詢相同的流程；推播的影片還沒出現在 RSS 時稍後再抓"""
+    print(f"[{datetime.datetime.now()}] WebSub notification for {source.handler.display_name} feed {source.label}")
+    metrics.inc('websub_notifications_total', feed=source.key)
+    state = state_store.get(source.key)
+    if not state.seen_initialized:
+        # 還沒有完整的 seen set，無法判斷推播的是不是新影片：交給下一次輪詢處理
+        print(f"Seen set for {source.label} not initialized yet. Leaving the notification to the next poll.")
+        return
+    # 舊影片被編輯時 hub 也會推送，發佈時間太舊的不通知
+    cutoff = time.time() - config['websub_max_entry_age']
+    entries = [entry for entry in feed.entries if (entry_epoch(entry) or time.time()) >= cutoff]
+    pushed_ids = {source.handler.entry_id(entry) for entry in entries} - {None}
+    if not any(entry_id not in state.seen for entry_id in pushed_ids):
+        return
+    for delay in (0, *config['websub_refetch_delays']):
+        await asyncio.sleep(delay)
+        try:
+            await poll_feed(source)
+        except Exception as e:
+            print(f"Error polling {source.label} after a WebSub notification: {e}")
+        state = state_store.get(source.key)
+        if all(entry_id in state.seen for entry_id in pushed_ids):
             return
+    print(f"WebSub notification for {source.label} is still not in the RSS feed. Leaving it to the next poll.")
 
-        last_notified = load_last_id(youtube_latest_path, 'video_id')
-
-        if video_id != last_notified['video_id']:
-            print(f'檢測到新的 YouTube 影片: {latest_video.title}')
-            link = latest_video.link
-            timestamp_dt = get_timestamp_from_entry(latest_video)
-            title = latest_video.title if hasattr(latest_video, 'title') else "無標題影片"
-            summary = clean_html(latest_video.summary) if hasattr(latest_video, 'summary') else "無描述"
-
-            embed = discord.Embed(
-                title=f"[YouTube 更新] {title}",
-                url=link,
-                color=0xFF0000,
-                description=truncate_text(summary, 500), # 截斷描述
-                timestamp=timestamp_dt
-            )
-
-            author_name = latest_video.author if hasattr(latest_video, 'author') else (feed.feed.title if hasattr(feed.feed, 'title') else 'YouTube Channel')
-            author_icon = feed.feed.image.href if hasattr(feed.feed, 'image') and hasattr(feed.feed.image, 'href') else None
-            embed.set_author(name=author_name, icon_url=author_icon)
-
-            thumb_url = None
-            if hasattr(latest_video, 'media_thumbnail') and latest_video.media_thumbnail:
-                thumb_url = latest_video.media_thumbnail[0]['url']
-            elif hasattr(latest_video, 'get') and latest_video.get('media_thumbnail'):
-                 thumb_url = latest_video.get('media_thumbnail')[0].get('url')
-            if thumb_url:
-                embed.set_image(url=thumb_url)
-
-            embed.set_footer(text="YouTube 更新通知")
-
-            notification_sent_somewhere = False
-            for guild in client.guilds:
-                channel = discord.utils.get(guild.text_channels, name=config['youtube_channel_name'])
-                if channel:
-                    try:
-                        await channel.send(embed=embed)
-                        print(f"Sent YouTube update to {guild.name}/{channel.name}")
-                        notification_sent_somewhere = True
-                    except discord.Forbidden:
-                        print(f"權限錯誤: 無法在 {guild.name}/{channel.name} 發送 YouTube 更新.")
-                    except discord.HTTPException as e:
-                        print(f"HTTP 錯誤 ({e.status}): 無法在 {guild.name}/{channel.name} 發送 YouTube 更新: {e.text}")
-                    except Exception as e:
-                         print(f"未知錯誤在發送 YouTube 更新到 {guild.name}/{channel.name}: {e}")
-
-            if notification_sent_somewhere:
-                 save_last_id(youtube_latest_path, 'video_id', video_id)
-            else:
-                 print("YouTube notification was not sent to any channel. Not updating last ID.")
-
-    except Exception as error:
-        print(f'檢查 YouTube 更新時發生嚴重錯誤: {error}')
-        import traceback
-        traceback.print_exc() # 打印詳細的錯誤追蹤
-
-# --- 檢查 Instagram 更新 ---
-@tasks.loop(seconds=config['check_interval'])
-async def check_instagram_updates():
-    print(f"[{datetime.datetime.now()}] Checking Instagram updates...")
+websub = None
+if config['websub_enabled']:
+    if not config['websub_callback_url']:
+        print("Warning: 'websub_enabled' is set but 'websub_callback_url' is empty. Falling back to polling only.")
+    else:
+        websub = WebSubSubscriber(
+            config['websub_callback_url'],
+            on_websub_notification,
+            fetcher.parse,
+            hub_url=config['websub_hub_url'],
+            host=config['websub_listen_host'],
+            port=config['websub_listen_port'],
+            path=config['websub_path'],
+            secret=config['websub_secret'],
+            lease_seconds=config['websub_lease_seconds'],
+        )
+def websub_topic(source):
+    return youtube_topic_for(source.url) if websub is not None and source.kind == 'youtube' else None
+
+def enable_push(source):
+    topic = websub_topic(source)
+    if topic:
+        websub.add_topic(topic, source)
+        # 推播是主要來源，輪詢只作為備援
+        source.min_interval = config['websub_fallback_interval']
+    return topic
+
+for source in feed_sources:
+    enable_push(source)
+
+# 單一排程器併發輪詢所有 feed
+poll_policy = AdaptivePolicy(config['min_poll_interval'], config['max_poll_interval']) if config['adaptive_polling'] else None
+scheduler = PollScheduler(poll_feed, max_concurrency=config['max_concurrent_polls'], jitter=config['poll_jitter'],
+                          policy=poll_policy, metrics=metrics)
+for source in feed_sources:
+    scheduler.add_source(source)
+
+# --- 停機 / 斷線後的補發 ---
+catch_up_lock = asyncio.Lock()
+catch_up_task = None
+startup_fetch = None     # 登入後、on_ready 前就開始的第一次抓取 (啟動時的補發使用)
+disconnected_at = None   # gateway 斷線的時間 (epoch 秒)
+
+async def fetch_all(sources):
+    """併發抓取多個 feed (數量受 max_concurrent_polls 限制)，回傳 [(source, state, result 或 None), ...]"""
+    semaphore = asyncio.Semaphore(config['max_concurrent_polls'])
+    async def fetch(source):
+        state = state_store.get(source.key)
+        async with semaphore:
+            try:
+                return source, state, await fetch_feed(source, state)
+            except (WorkerLost, RuntimeError) as e:
+                print(f"{source.handler.display_name} feed {source.label} could not be fetched for catch-up: {e}")
+                return source, state, None
+    return await asyncio.gather(*(fetch(source) for source in sources))
+
+async def _send_catch_up(channel, messages, results):
+    # 同一個頻道依時間順序逐則送出；速率由 DeliveryQueue 的 token bucket 控制
+    for message in messages:
+        source = message.source
+        label = f"{source.handler.display_name} {source.label}"
+        if len(message.entries) > 1:
+            label += f" (digest of {len(message.entries)})"
+        outcome = (await delivery_queue.deliver(source.key, [(message.message_id, message.embed)], [channel],
+                                                label=label))[message.message_id][channel.id]
+        metrics.inc('catchup_messages_total', kind='digest' if len(message.entries) > 1 else 'entry',
+                    result=outcome)
+        for item in message.entries:
+            if message.message_id != item.entry_id and outcome in DELIVERED_RESULTS:
+                # 摘要送達：摘要裡的每則 entry 都算送到這個頻道
+                state_store.record_delivery(source.key, item.entry_id, channel.id)
+            results[(source.key, item.entry_id)][channel.id] = outcome
+        if outcome == SENT:
+            startup_phase('first_notification')
+
+async def catch_up(reason, since=None, prefetched=None):
+    """一次抓取所有 feed，把錯過的 entry 依時間順序補發到各頻道。
+    since (epoch 秒) 只用於還沒有 seen set 的 feed：發佈時間晚於 since 的 entry 都會補發。
+    prefetched 為已經開始的 fetch_all task (啟動時在登入後就先抓取)"""
+    if catch_up_lock.locked():
+        return
+    async with catch_up_lock:
+        started = time.monotonic()
+        if since is not None:
+            since = max(since, time.time() - config['catchup_max_age'])
+        print(f"[{datetime.datetime.now()}] Catching up on {len(feed_sources)} feeds after {reason}...")
+        fetched = await (prefetched or fetch_all(list(feed_sources)))
+        sources = [source for source, _, _ in fetched]
+
+        async with contextlib.AsyncExitStack() as stack:
+            # 補發期間暫停這些 feed 的輪詢與推播處理 (依 key 排序取得 lock，避免互相等待)
+            for source in sorted(sources, key=lambda source: source.key):
+                await stack.enter_async_context(feed_locks[source.key])
+
+            polled = []
+            for source, state, result in fetched:
+                if result is None or result.not_modified or not result.entries:
+                    continue
+                if state_store.get(source.key) is not state:
+                    continue
+                pending, _, all_rendered = collect_new_entries(source, result.feed, result.feed.entries,
+                                                               since=since, **_record_options())
+                polled.append((source, state, result, pending, all_rendered))
+
+            # 所有 feed 錯過的 entry 依時間合併，再分配到各頻道
+            ordered = merge_chronological([pending for _, _, _, pending, _ in polled])
+            results = {(item.source.key, item.entry_id): {} for item in ordered}
+            channels = {}
+            per_channel = collections.defaultdict(list)
+            skips = {}
+            for source, _, _, pending, _ in polled:
+                if pending:
+                    skips[source.key] = claim_duplicates(source, pending, channel_router.channels_for(source.key))
+            for item in ordered:
+                for channel in channel_router.channels_for(item.source.key):
+                    channels[channel.id] = channel
+                    if item.entry_id in skips[item.source.key].get(channel.id, ()):
+                        results[(item.source.key, item.entry_id)][channel.id] = COALESCED
+                    elif state_store.has_delivery(item.source.key, item.entry_id, channel.id):
+                        results[(item.source.key, item.entry_id)][channel.id] = DUPLICATE
+                    else:
+                        per_channel[channel.id].append(item)
+
+            plans = {channel_id: plan_channel(items, config['catchup_digest_threshold'], config['catchup_digest_size'])
+                     for channel_id, items in per_channel.items()}
+            await asyncio.gather(*(_send_catch_up(channels[channel_id], messages, results)
+                                   for channel_id, messages in plans.items()))
+
+            for source, state, result, pending, all_rendered in polled:
+                source_results = {item.entry_id: results[(source.key, item.entry_id)] for item in pending}
+                all_delivered = settle_entries(source, state, pending, source_results) and all_rendered
+                finish_feed(source, state, result, all_delivered)
+
+        elapsed = time.monotonic() - started
+        metrics.inc('catchup_runs_total', reason=reason.split(' ')[0])
+        metrics.inc('catchup_entries_total', len(ordered))
+        metrics.observe('catchup_seconds', elapsed)
+        message_count = sum(len(messages) for messages in plans.values())
+        print(f"Catch-up finished in {elapsed:.1f}s: {len(ordered)} missed entries from {len(polled)} feeds, "
+              f"{message_count} messages to {len(plans)} channels.")
+
+def catch_up_after_reconnect():
+    """gateway 重新連線時呼叫：斷線夠久才補發"""
+    global catch_up_task, disconnected_at
+    if disconnected_at is None:
+        return
+    downtime = time.time() - disconnected_at
+    since, disconnected_at = disconnected_at, None
+    if config['catchup_enabled'] and downtime >= config['catchup_min_downtime']:
+        catch_up_task = asyncio.create_task(catch_up(f"reconnect ({downtime:.0f}s offline)", since),
+                                            name='catch-up')
+
+# --- 套用重新載入的 feed 設定 (只動有變化的 feed) ---
+async def apply_feed_config(values):
+    # 先在暫存的變數中建立所有 feed 與路由，全部成功才開始套用；失敗時還原 config
+    previous = {key: config.get(key) for key in FEED_CONFIG_KEYS}
+    config.update(base_feed_config)
+    config.update(values)
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'} # 模擬瀏覽器
-        feed = feedparser.parse(config['instagram_rss'], agent=headers.get('User-Agent'))
-        if not feed.entries:
-            print("Instagram feed empty or failed to load.")
-            return
-
-        latest_post = feed.entries[0]
-        post_id = latest_post.link # 連結通常是唯一的 ID
-        if not post_id:
-            print("Could not extract post link (ID) from Instagram feed entry.")
-            return
-
-        last_notified = load_last_id(instagram_latest_path, 'post_id')
-
-        if post_id != last_notified['post_id']:
-            print(f'檢測到新的 Instagram 貼文: {latest_post.title}')
-            link = latest_post.link
-            timestamp_dt = get_timestamp_from_entry(latest_post)
-            # Instagram 的 title 和 description 可能混亂，優先用 summary
-            content = latest_post.summary if hasattr(latest_post, 'summary') else (latest_post.title if hasattr(latest_post, 'title') else "")
-            cleaned_content = clean_html(content)
-
-            embed = discord.Embed(
-                title="[Instagram 更新]",
-                url=link,
-                color=0xE1306C,
-                description=truncate_text(cleaned_content, 300), # 截斷內文
-                timestamp=timestamp_dt
-            )
-
-            # 作者通常是 entry author 或 feed title
-            author_name = latest_post.author if hasattr(latest_post, 'author') else (feed.feed.title if hasattr(feed.feed, 'title') else 'Instagram')
-            # 嘗試從 feed title 提取帳號名（如果有的話）
-            if 'Instagram feed for @' in author_name:
-                 author_name = author_name.split('@')[1].strip()
-            embed.set_author(name=author_name)
-
-            image_url = None
-            # 嘗試從 enclosures 找圖片
-            if hasattr(latest_post, 'enclosures') and latest_post.enclosures:
-                for enc in latest_post.enclosures:
-                    if enc.get('type', '').startswith('image/'):
-                        image_url = enc.href
-                        break
-            # 如果 enclosures 沒有，嘗試從 summary/content 的 HTML 中解析 img 標籤
-            if not image_url and content and BeautifulSoup:
-                 try:
-                     soup = BeautifulSoup(content, 'html.parser')
-                     img_tag = soup.find('img')
-                     if img_tag and img_tag.get('src'):
-                         image_url = img_tag['src']
-                 except Exception as e:
-                     print(f"Error parsing image from Instagram summary HTML: {e}")
-
-            if image_url:
-                embed.set_image(url=image_url)
-
-            embed.set_footer(text="Instagram 更新通知")
-
-            notification_sent_somewhere = False
-            for guild in client.guilds:
-                channel = discord.utils.get(guild.text_channels, name=config['instagram_channel_name'])
-                if channel:
-                    try:
-                        await channel.send(embed=embed)
-                        print(f"Sent Instagram update to {guild.name}/{channel.name}")
-                        notification_sent_somewhere = True
-                    except discord.Forbidden:
-                        print(f"權限錯誤: 無法在 {guild.name}/{channel.name} 發送 Instagram 更新.")
-                    except discord.HTTPException as e:
-                        print(f"HTTP 錯誤 ({e.status}): 無法在 {guild.name}/{channel.name} 發送 Instagram 更新: {e.text}")
-                    except Exception as e:
-                         print(f"未知錯誤在發送 Instagram 更新到 {guild.name}/{channel.name}: {e}")
-
-            if notification_sent_somewhere:
-                save_last_id(instagram_latest_path, 'post_id', post_id)
-            else:
-                print("Instagram notification was not sent to any channel. Not updating last ID.")
-
-    except Exception as error:
-        print(f'檢查 Instagram 更新時發生嚴重錯誤: {error}')
-        import traceback
-        traceback.print_exc()
-
-# --- 檢查 Twitter 更新 ---
-@tasks.loop(seconds=config['check_interval'])
-async def check_twitter_updates():
-    print(f"[{datetime.datetime.now()}] Checking Twitter updates...")
-    for i, rss_url in enumerate(config['twitter_rss']):
-        filepath = twitter_latest_paths[i]
-        account_name_from_file = os.path.basename(filepath).replace('_latest.json', '') # 用於日誌記錄
-        try:
-            print(f"Checking Twitter account: {account_name_from_file} via {rss_url}")
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            feed = feedparser.parse(rss_url, agent=headers.get('User-Agent'))
-            if not feed.entries:
-                print(f"Twitter feed for {account_name_from_file} empty or failed to load.")
-                continue
-
-            latest_tweet = feed.entries[0]
-            tweet_id = latest_tweet.link # 推文連結是最好的 ID
-            if not tweet_id:
-                print(f"Could not extract tweet link (ID) for {account_name_from_file}.")
-                continue
-
-            last_notified = load_last_id(filepath, 'tweet_id')
-
-            if tweet_id != last_notified['tweet_id']:
-                print(f'檢測到新的 Twitter 推文 from {account_name_from_file}: {latest_tweet.title}')
-                link = latest_tweet.link
-                timestamp_dt = get_timestamp_from_entry(latest_tweet)
-                # 推文內容通常在 title
-                content = latest_tweet.title if hasattr(latest_tweet, 'title') else ""
-                cleaned_content = clean_html(content) # 清理 HTML 實體等
-
-                embed = discord.Embed(
-                    title="[Twitter 更新]",
-                    url=link,
-                    color=0x1DA1F2,
-                    description=truncate_text(cleaned_content, 300), # 截斷內文
-                    timestamp=timestamp_dt
-                )
-
-                # 作者名通常在 entry.author
-                author_name = latest_tweet.author if hasattr(latest_tweet, 'author') else account_name_from_file
-                # 嘗試移除可能的前綴如 "(@username)"
-                if author_name.startswith("(") and author_name.endswith(")"):
-                     author_name = author_name[1:-1]
-                embed.set_author(name=author_name)
-
-                image_url = None
-                # 優先從 media_content (rss.app 常用)
-                if hasattr(latest_tweet, 'media_content') and latest_tweet.media_content:
-                     for media in latest_tweet.media_content:
-                         if media.get('medium') == 'image' and media.get('url'):
-                             image_url = media['url']
-                             break
-                # 其次嘗試 enclosures
-                if not image_url and hasattr(latest_tweet, 'enclosures') and latest_tweet.enclosures:
-                     for enc in latest_tweet.enclosures:
-                         if enc.get('type', '').startswith('image/'):
-                             image_url = enc.href
-                             break
-                # 最後嘗試從 summary/content HTML 解析 (效果可能不佳)
-                if not image_url and hasattr(latest_tweet, 'summary') and BeautifulSoup:
-                     try:
-                         soup = BeautifulSoup(latest_tweet.summary, 'html.parser')
-                         img_tag = soup.find('img')
-                         if img_tag and img_tag.get('src'):
-                             image_url = img_tag['src']
-                     except Exception as e:
-                        print(f"Error parsing image from Twitter summary HTML: {e}")
-
-                if image_url:
-                    embed.set_image(url=image_url)
-
-                embed.set_footer(text="Twitter 更新通知")
-
-                notification_sent_somewhere = False
-                for guild in client.guilds:
-                    channel = discord.utils.get(guild.text_channels, name=config['twitter_channel_name'])
-                    if channel:
-                        try:
-                            await channel.send(embed=embed)
-                            print(f"Sent Twitter update for {account_name_from_file} to {guild.name}/{channel.name}")
-                            notification_sent_somewhere = True
-                        except discord.Forbidden:
-                            print(f"權限錯誤: 無法在 {guild.name}/{channel.name} 發送 Twitter 更新 for {account_name_from_file}.")
-                        except discord.HTTPException as e:
-                            print(f"HTTP 錯誤 ({e.status}): 無法在 {guild.name}/{channel.name} 發送 Twitter 更新 for {account_name_from_file}: {e.text}")
-                        except Exception as e:
-                             print(f"未知錯誤在發送 Twitter 更新到 {guild.name}/{channel.name}: {e}")
-
-                if notification_sent_somewhere:
-                    save_last_id(filepath, 'tweet_id', tweet_id)
-                else:
-                    print(f"Twitter notification for {account_name_from_file} was not sent. Not updating last ID.")
-
-        except Exception as error:
-            print(f'檢查 Twitter 帳號 {account_name_from_file} ({rss_url}) 時發生嚴重錯誤: {error}')
-            import traceback
-            traceback.print_exc()
-
+        updated, routes = build_feeds()
+    except (KeyError, TypeError, ValueError) as e:
+        config.update(previous)
+        print(f"Invalid feed config, keeping the current feeds: {e}")
+        return
+    added, removed, retuned, moved = diff_sources(feed_sources, updated)
+    current = {source.key: source for source in feed_sources}
+
+    for source in removed:
+        # 狀態留在資料庫，之後再加回來時會接續
+        scheduler.remove_source(source.key)
+        channel_router.remove_route(source.key)
+        render_cache.invalidate(source.key)
+        del current[source.key]
+        if websub_topic(source):
+            await websub.remove_topic(websub_topic(source))
+        print(f"Feed removed: {source.kind} {source.label}")
+
+    for old, new in retuned:
+        # 同一個 feed：直接調整執行中的物件，排程時間與狀態都不變
+        old.interval, old.channel_ids, old.label = new.interval, new.channel_ids, new.label
+        render_cache.invalidate(old.key)   # embed 可能用到 feed 的名稱
+        if poll_policy is not None:
+            poll_policy.forget(old.key)
+        print(f"Feed retuned: {old.kind} {old.label} (interval {old.interval}s)")
+
+    for old, new in moved:
+        # 同一個 key 換成另一個 URL：舊的 seen set 對新的 feed 沒有意義，重新 bootstrap
+        async with feed_locks[old.key]:
+            state_store.reset(old.key)
+            render_cache.invalidate(old.key)
+        if websub_topic(old):
+            await websub.remove_topic(websub_topic(old))
+        current[new.key] = new
+        print(f"Feed URL changed: {new.kind} {new.label} -> {new.url}")
+
+    for new in added + [new for _, new in moved]:
+        current[new.key] = new
+        if enable_push(new) and websub.is_running():
+            await websub.subscribe(websub_topic(new))
+        scheduler.add_source(new)
+        if new in added:
+            print(f"Feed added: {new.kind} {new.label} ({new.url})")
+
+    # 保持設定檔中的順序
+    feed_sources[:] = [current[source.key] for source in updated]
+    for source in feed_sources:
+        route_source(source, routes[source.key])
+    if client.is_ready():
+        routed_channels = channel_router.rebuild(client.guilds)
+        if webhook_registry is not None:
+            await webhook_registry.register_many(routed_channels)
+    state_store.schedule_flush(config['state_flush_delay'])
+    print(f"Feed config applied: {len(added)} added, {len(removed)} removed, "
+          f"{len(retuned)} retuned, {len(moved)} moved, {len(feed_sources)} feeds total.")
+
+feed_config_watcher = FeedConfigWatcher(config['feeds_file'], apply_feed_config,
+                                        interval=config['feeds_file_check_interval'])
 
 # --- Bot Events ---
 @client.event
 async def on_ready():
+    global disconnected_at
     print(f'機器人已登入為 {client.user.name} ({client.user.id})')
     print(f'正在監控 {len(client.guilds)} 個伺服器')
     print('正在啟動檢查任務...')
     # 等待 Bot 完全準備好再啟動 tasks
     await client.wait_until_ready()
-    if not check_youtube_updates.is_running():
-        check_youtube_updates.start()
-    if not check_instagram_updates.is_running():
-        check_instagram_updates.start()
-    if not check_twitter_updates.is_running():
-        check_twitter_updates.start()
-    print(f"檢查任務已啟動，檢查間隔: {config['check_interval']} 秒.")
+    routed_channels = channel_router.rebuild(client.guilds)
+    if webhook_registry is not None:
+        webhook_registry.username = client.user.name
+        webhook_registry.avatar_url = client.user.display_avatar.url
+        await webhook_registry.register_many(routed_channels)
+    delivery_queue.start()
+    if not scheduler.is_running():
+        startup_phase('ready')
+        disconnected_at = None
+        if config['catchup_enabled']:
+            # 排程器啟動前先補發停機期間錯過的 entry (feed 在登入後就已經開始抓取)
+            try:
+                await catch_up('startup', state_store.last_active, prefetched=startup_fetch)
+            except Exception as e:
+                print(f"Catch-up after startup failed: {e}")
+        scheduler.start(stagger=config['stagger_first_polls'], just_polled=config['catchup_enabled'])
+        feed_config_watcher.start()
+        if websub is not None and not await websub.start():
+            # callback 伺服器無法啟動：恢復 YouTube 的正常輪詢間隔
+            for source in websub.topics.values():
+                source.min_interval = None
+    else:
+        # 重新連線 (無法 resume 時會再收到 on_ready)
+        catch_up_after_reconnect()
+    print(f"檢查任務已啟動，共 {len(scheduler.sources)} 個 feed，預設檢查間隔: {config['check_interval']} 秒.")
+
+@client.event
+async def on_disconnect():
+    global disconnected_at
+    if disconnected_at is None:
+        disconnected_at = time.time()
+
+@client.event
+async def on_resumed():
+    catch_up_after_reconnect()
 
 @client.event
 async def on_guild_join(guild):
     print(f"機器人已加入新的伺服器: {guild.name} (ID: {guild.id})")
-    # 你可以在這裡添加歡迎訊息或檢查頻道是否存在
+    added = channel_router.add_guild(guild)
+    if webhook_registry is not None:
+        await webhook_registry.register_many(added)
 
 @client.event
 async def on_guild_remove(guild):
     print(f"機器人已離開伺服器: {guild.name} (ID: {guild.id})")
+    channel_router.remove_guild(guild)
+
+# --- 頻道變動時增量更新路由索引 ---
+@client.event
+async def on_guild_channel_create(channel):
+    if isinstance(channel, discord.TextChannel) and channel_router.add_channel(channel):
+        if webhook_registry is not None:
+            await webhook_registry.register(channel)
+
+@client.event
+async def on_guild_channel_delete(channel):
+    channel_router.remove_channel(channel)
+
+@client.event
+async def on_guild_channel_update(before, after):
+    if isinstance(after, discord.TextChannel):
+        if channel_router.update_channel(before, after) and webhook_registry is not None:
+            await webhook_registry.register(after)
+    else:
+        channel_router.remove_channel(before)
 
 
 # --- 啟動 Bot ---
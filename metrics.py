@@ -0,0 +1,219 @@
+# --- START OF FILE metrics.py ---
+# 輕量的內建 metrics (不依賴 prometheus_client)：
+#   - counter / gauge / histogram，以 label 區分 feed、頻道、狀態碼等
+#   - 在本機的 HTTP endpoint 以 Prometheus 文字格式輸出 (/metrics)
+#   - 每個週期印出一行 JSON 摘要 (與上一個週期相比的增量)，方便直接從日誌觀察
+#   - 監控 event loop 的延遲 (loop lag)
+#   - 停用時所有記錄方法第一行就返回，幾乎沒有成本
+
+import asyncio
+import bisect
+import datetime
+import json
+
+
+# aiohttp.web 只有在啟動 HTTP 伺服器時才需要，延遲載入以縮短 bot 的啟動時間
+web = None
+
+def _load_web():
+    global web
+    if web is None:
+        from aiohttp import web as aiohttp_web
+        web = aiohttp_web
+    return web
+
+
+# 延遲類 histogram 的 bucket 上限 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRIPTIONS = {
+    'feed_fetch_seconds': 'Time spent downloading a feed',
+    'feed_fetch_bytes_total': 'Bytes downloaded per feed',
+    'feed_fetch_total': 'Feed fetches by HTTP status (304 = not modified, error = network failure)',
+    'feed_parse_seconds': 'Time spent parsing a downloaded feed',
+    'feed_entries_processed_total': 'Entries examined for new content',
+    'feed_new_entries_total': 'New entries detected',
+    'embed_render_seconds': 'Time spent building an embed (render cache misses only)',
+    'render_cache_requests_total': 'Render cache lookups by result',
+    'delivery_send_seconds': 'Time spent in one Discord send request per channel',
+    'delivery_results_total': 'Delivery outcomes per entry and channel',
+    'delivery_retries_total': 'Delivery retries by HTTP status',
+    'delivery_queue_depth': 'Delivery jobs waiting in the queue',
+    'poll_lag_seconds': 'How far behind its scheduled time a poll started',
+    'poll_duration_seconds': 'Total time of one poll including delivery',
+    'websub_notifications_total': 'WebSub push notifications received',
+    'dedup_coalesced_total': 'Channel deliveries skipped because another feed already sent the same content',
+    'catchup_runs_total': 'Catch-up passes by trigger',
+    'catchup_entries_total': 'Missed entries found by catch-up passes',
+    'catchup_messages_total': 'Catch-up messages by kind (single entry or digest) and result',
+    'catchup_seconds': 'Duration of a catch-up pass',
+    'startup_seconds': 'Seconds from process start to each startup phase',
+    'event_loop_lag_seconds': 'Event loop scheduling delay',
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._types = {}          # name -> 'counter' / 'gauge' / 'histogram'
+        self._values = {}         # name -> {label_key: float 或 _Histogram}
+        self._last_summary = {}   # (name, label_key) -> 上一個週期的 (值 或 (count, sum))
+        self._runner = None
+        self._tasks = []
+
+    # --- 記錄 ---
+    def _series(self, name, kind):
+        series = self._values.get(name)
+        if series is None:
+            series = self._values[name] = {}
+            self._types[name] = kind
+        return series
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        series = self._series(name, 'counter')
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self._series(name, 'gauge')[_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        series = self._series(name, 'histogram')
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = _Histogram(self.buckets)
+        histogram.observe(value)
+
+    # --- 輸出 ---
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for name in sorted(self._values):
+            kind = self._types[name]
+            if name in DESCRIPTIONS:
+                lines.append(f'# HELP {name} {DESCRIPTIONS[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in sorted(self._values[name].items()):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {value.sum}')
+                lines.append(f'{name}_count{_format_labels(key)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """與上一次呼叫相比的增量：counter 為增加量，histogram 為次數與平均值，gauge 為目前的值。
+        這個週期沒有變化的 series 不會出現"""
+        result = {}
+        for name, series in self._values.items():
+            kind = self._types[name]
+            for key, value in series.items():
+                series_name = f'{name}{_format_labels(key)}'
+                previous = self._last_summary.get((name, key))
+                if kind == 'gauge':
+                    result[series_name] = value
+                elif kind == 'counter':
+                    delta = value - (previous or 0)
+                    self._last_summary[(name, key)] = value
+                    if delta:
+                        result[series_name] = delta
+                else:
+                    last_count, last_sum = previous or (0, 0.0)
+                    count = value.count - last_count
+                    self._last_summary[(name, key)] = (value.count, value.sum)
+                    if count:
+                        result[series_name] = {'count': count, 'avg': round((value.sum - last_sum) / count, 6)}
+        return result
+
+    # --- 生命週期 ---
+    async def start(self, host='127.0.0.1', port=9108, log_interval=300, lag_interval=1.0):
+        if not self.enabled or self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._monitor_loop_lag(lag_interval), name='metrics-loop-lag'))
+        if log_interval:
+            self._tasks.append(asyncio.create_task(self._log_summaries(log_interval), name='metrics-summary'))
+        if port:
+            _load_web()
+            app = web.Application()
+            app.router.add_get('/metrics', self._handle_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            try:
+                await web.TCPSite(self._runner, host, port).start()
+                print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"Could not start metrics endpoint on {host}:{port}: {e}")
+                await self._runner.cleanup()
+                self._runner = None
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def _monitor_loop_lag(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - expected)
+            self.observe('event_loop_lag_seconds', lag)
+
+    async def _log_summaries(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            summary = self.summary()
+            if summary:
+                print('metrics ' + json.dumps({'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                                               'interval': interval, 'metrics': summary},
+                                              ensure_ascii=False, sort_keys=True))
+
+# --- END OF FILE metrics.py ---
@@ -0,0 +1,241 @@
+# --- START OF FILE poll_scheduler.py ---
+# 單一的輪詢排程器，取代原本三個各自獨立的 tasks.loop：
+#   - 所有 feed 併發輪詢，但同時進行中的數量受 max_concurrency 限制
+#   - 每個 feed 有自己的間隔，並加上隨機 jitter 避免所有 feed 同時觸發
+#   - 下一次的時間以「預定開始時間 + 間隔」計算，慢的 feed 不會拖累其他 feed
+#   - (可選) 啟動時第一次輪詢平均分散在各 feed 的間隔內，不會所有 feed 在同一刻一起抓取
+#   - (可選) AdaptivePolicy 依照每個 feed 的發文頻率與輪詢結果自動調整間隔
+
+import asyncio
+import random
+import statistics
+import time
+import traceback
+
+
+class PollOutcome:
+    """poll_func 回傳給排程器的結果，用來調整下一次的間隔"""
+
+    def __init__(self, changed=False, error=False, rate_limited=False, min_delay=None, entry_times=()):
+        self.changed = changed            # 有新的 entry
+        self.error = error                # 抓取或解析失敗
+        self.rate_limited = rate_limited  # 429 (或帶 Retry-After 的 503)
+        self.min_delay = min_delay        # 伺服器要求的最短間隔 (Retry-After / Cache-Control / ttl)
+        self.entry_times = entry_times    # feed 中 entry 的發佈時間 (epoch 秒)
+
+
+class _FeedCadence:
+    def __init__(self, interval):
+        self.interval = interval
+        self.post_gap = None      # 估計的平均發文間隔 (秒)
+        self.idle_polls = 0       # 連續沒有變化的輪詢次數
+        self.errors = 0           # 連續失敗次數
+
+
+class AdaptivePolicy:
+    """依據發文頻率調整輪詢間隔：
+    活躍的 feed 縮短到約為發文間隔的 1/polls_per_post；
+    連續沒有變化、失敗或被 429 時以指數退避拉長；
+    伺服器提供的 Retry-After / Cache-Control / ttl 視為最短間隔"""
+
+    def __init__(self, min_interval=60, max_interval=3600, backoff_factor=1.5,
+                 error_backoff_factor=2.0, polls_per_post=4, history=10):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.error_backoff_factor = error_backoff_factor
+        self.polls_per_post = polls_per_post
+        self.history = history
+        self._cadence = {}
+
+    def _clamp(self, seconds):
+        return max(self.min_interval, min(self.max_interval, seconds))
+
+    def forget(self, key):
+        self._cadence.pop(key, None)
+
+    def current_interval(self, source):
+        cadence = self._cadence.get(source.key)
+        return cadence.interval if cadence else source.interval
+
+    def next_interval(self, source, outcome):
+        cadence = self._cadence.get(source.key)
+        if cadence is None:
+            cadence = self._cadence[source.key] = _FeedCadence(source.interval)
+
+        if outcome.entry_times:
+            times = sorted(outcome.entry_times)[-self.history:]
+            gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+            if gaps:
+                cadence.post_gap = statistics.median(gaps)
+
+        # 以發文頻率推算的基準間隔；還沒有資料時用設定的間隔
+        if cadence.post_gap:
+            target = cadence.post_gap / self.polls_per_post
+        else:
+            target = source.interval
+
+        # 退避到 max_interval 之後計數就不再增加，否則長期沒有變化 / 失敗的 feed 會讓次方運算溢位
+        if outcome.rate_limited or outcome.error:
+            if target * self.error_backoff_factor ** cadence.errors < self.max_interval:
+                cadence.errors += 1
+            interval = target * self.error_backoff_factor ** cadence.errors
+        else:
+            cadence.errors = 0
+            if outcome.changed:
+                cadence.idle_polls = 0
+            elif target * self.backoff_factor ** cadence.idle_polls < self.max_interval:
+                cadence.idle_polls += 1
+            interval = target * self.backoff_factor ** cadence.idle_polls
+
+        interval = self._clamp(interval)
+        if outcome.min_delay:
+            # 伺服器的要求優先於 max_interval
+            interval = max(interval, outcome.min_delay)
+        cadence.interval = interval
+        return interval
+
+
+class PollScheduler:
+    def __init__(self, poll_func, max_concurrency=5, jitter=0.1, policy=None, metrics=None):
+        self._poll_func = poll_func          # async def poll_func(source) -> PollOutcome 或 None
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter                 # 間隔的隨機浮動比例 (0.1 = ±10%)
+        self.policy = policy                 # AdaptivePolicy；None 表示固定使用 source.interval
+        self.metrics = metrics               # Metrics；None 表示不記錄
+        self._semaphore = None
+        self._sources = {}                   # key -> FeedSource
+        self._next_due = {}                  # key -> loop.time() 的預定時間
+        self._in_flight = set()
+        self._poll_tasks = set()             # 進行中的輪詢 task (保留參照，避免被 GC；stop 時取消)
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def sources(self):
+        return list(self._sources.values())
+
+    # --- Feed 管理 ---
+    def add_source(self, source, delay=0.0):
+        """加入一個 feed；delay 秒後進行第一次輪詢"""
+        self._sources[source.key] = source
+        self._next_due[source.key] = self._now() + delay
+        self._wake()
+
+    def remove_source(self, key):
+        self._sources.pop(key, None)
+        self._next_due.pop(key, None)
+        if self.policy is not None:
+            self.policy.forget(key)
+        self._wake()
+
+    # --- 生命週期 ---
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, stagger=False, just_polled=False):
+        """stagger 為 True 時，第 i 個 feed 的第一次輪詢延後 i/n 個間隔；
+        just_polled 表示所有 feed 剛剛才抓取過 (例如啟動時的補發)，第一個 feed 也延後 1/n 個間隔"""
+        if self.is_running():
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        # 在 start 之前加入的 feed 以 event loop 的時間重新計算
+        now = self._now()
+        keys = list(self._next_due)
+        for index, key in enumerate(keys):
+            delay = 0.0
+            if stagger:
+                slot = (index + 1 if just_polled else index) / len(keys)
+                delay = slot * self._first_interval(self._sources[key])
+            self._next_due[key] = now + delay
+        self._task = asyncio.create_task(self._run(), name='poll-scheduler')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._poll_tasks):
+            task.cancel()
+        await asyncio.gather(*self._poll_tasks, return_exceptions=True)
+        self._poll_tasks.clear()
+
+    # --- 內部 ---
+    def _now(self):
+        try:
+            return asyncio.get_running_loop().time()
+        except RuntimeError:
+            return 0.0
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _first_interval(self, source):
+        interval = self.policy.current_interval(source) if self.policy is not None else source.interval
+        return max(interval, source.min_interval or 0)
+
+    def _next_interval(self, source, outcome):
+        interval = source.interval
+        if self.policy is not None and outcome is not None:
+            interval = self.policy.next_interval(source, outcome)
+        if source.min_interval:
+            interval = max(interval, source.min_interval)
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if outcome is not None and outcome.min_delay:
+            # 伺服器要求的最短間隔 (Retry-After / Cache-Control / ttl) 不論是否使用 policy 都要遵守
+            interval = max(interval, outcome.min_delay)
+        return interval
+
+    async def _run(self):
+        while True:
+            now = self._now()
+            for key, due in list(self._next_due.items()):
+                if due <= now and key not in self._in_flight:
+                    self._in_flight.add(key)
+                    task = asyncio.create_task(self._poll_one(self._sources[key], due), name=f'poll:{key}')
+                    self._poll_tasks.add(task)
+                    task.add_done_callback(self._poll_tasks.discard)
+
+            pending = [due for key, due in self._next_due.items() if key not in self._in_flight]
+            timeout = max(0.0, min(pending) - now) if pending else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_one(self, source, scheduled_at):
+        outcome = None
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                if self.metrics is not None:
+                    # 排程落後多少 (包含等待 semaphore 的時間)
+                    self.metrics.observe('poll_lag_seconds', max(0.0, self._now() - scheduled_at), feed=source.key)
+                outcome = await self._poll_func(source)
+                if self.metrics is not None:
+                    self.metrics.observe('poll_duration_seconds', time.perf_counter() - started, feed=source.key)
+        except Exception as error:
+            print(f'輪詢 {source.kind} feed {source.label} ({source.url}) 時發生嚴重錯誤: {error}')
+            traceback.print_exc()
+            outcome = PollOutcome(error=True)
+        finally:
+            self._in_flight.discard(source.key)
+            if source.key in self._sources:
+                try:
+                    interval = self._next_interval(source, outcome)
+                except Exception as error:
+                    # 計算間隔失敗也要排下一次輪詢，否則這個 feed (或整個排程器) 會停住
+                    print(f'計算 {source.kind} feed {source.label} 的輪詢間隔時發生錯誤: {error}')
+                    interval = max(source.interval, source.min_interval or 0)
+                # 以預定時間為基準，輪詢花費的時間不會累積成延遲
+                self._next_due[source.key] = max(scheduled_at + interval, self._now())
+            self._wake()
+
+# --- END OF FILE poll_scheduler.py ---
@@ -0,0 +1,73 @@
+# --- START OF FILE render_cache.py ---
+# Entry → embed 的渲染快取：
+#   同一則 entry 在重試、多頻道發送、下一次輪詢時不需要重新解析時間、清理 HTML、找縮圖。
+#   以 (feed, entry ID) 為 key，並記錄 entry 內容的 hash；內容改變 (例如貼文被編輯) 時自動失效重建。
+#   容量有上限 (LRU)。feed 被移除或設定改變時由 apply_feed_config 清除該 feed 的快取。
+
+import collections
+import hashlib
+import json
+import time
+
+
+# 會影響 embed 內容的 entry 欄位
+_HASHED_FIELDS = ('title', 'summary', 'link', 'published', 'updated', 'author',
+                  'media_thumbnail', 'media_content', 'enclosures')
+
+
+def content_hash(feed, entry):
+    """entry (以及 embed 會用到的 feed 標題/圖示) 內容的 hash"""
+    payload = {field: entry.get(field) for field in _HASHED_FIELDS}
+    feed_info = getattr(feed, 'feed', None) or {}
+    payload['_feed_title'] = feed_info.get('title')
+    payload['_feed_image'] = (feed_info.get('image') or {}).get('href')
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, capacity=512, metrics=None):
+        self.capacity = capacity
+        self.metrics = metrics       # Metrics；None 表示不記錄
+        self._items = collections.OrderedDict()   # (feed_key, entry_id) -> (content_hash, embed)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_or_render(self, source, feed, entry_id, entry):
+        """回傳快取的 embed；沒有快取或內容已改變時呼叫 handler 重新渲染"""
+        key = (source.key, entry_id)
+        digest = content_hash(feed, entry)
+        cached = self._items.get(key)
+        if cached is not None:
+            if cached[0] == digest:
+                self._items.move_to_end(key)
+                self.hits += 1
+                if self.metrics is not None:
+                    self.metrics.inc('render_cache_requests_total', result='hit')
+                return cached[1]
+            self.invalidations += 1
+        self.misses += 1
+        started = time.perf_counter()
+        embed = source.handler.build_embed(source, feed, entry)
+        if self.metrics is not None:
+            self.metrics.inc('render_cache_requests_total', result='miss')
+            self.metrics.observe('embed_render_seconds', time.perf_counter() - started, feed=source.key)
+        self._items[key] = (digest, embed)
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return embed
+
+    def invalidate(self, feed_key, entry_id=None):
+        """清除一則 entry (或整個 feed) 的快取"""
+        if entry_id is not None:
+            self._items.pop((feed_key, entry_id), None)
+            return
+        for key in [key for key in self._items if key[0] == feed_key]:
+            del self._items[key]
+
+# --- END OF FILE render_cache.py ---
@@ -0,0 +1,101 @@
+# --- START OF FILE seen_entries.py ---
+# 每個 feed 的「已看過」entry 記錄：
+#   不再只比對 feed.entries[0]，而是對 feed 裡所有 entry 做 set 查詢，
+#   依時間順序 (舊 → 新) 回傳所有沒看過的 entry。
+#   記錄本身是有上限的 LRU，記憶體不會隨時間無限成長。
+
+import calendar
+import collections
+
+
+class SeenSet:
+    """有容量上限的 LRU set。超過上限時淘汰最久沒出現在 feed 裡的 ID"""
+
+    def __init__(self, ids=(), capacity=500):
+        self.capacity = capacity
+        self._ids = collections.OrderedDict()
+        for entry_id in ids:
+            self.add(entry_id)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, entry_id):
+        self._ids[entry_id] = None
+        self._ids.move_to_end(entry_id)
+        while len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+    def ensure_capacity(self, size):
+        # 容量至少要能容納整個 feed，否則仍在 feed 裡的 ID 會被淘汰
+        if size > self.capacity:
+            self.capacity = size
+
+    def touch(self, entry_id):
+        # 仍然出現在 feed 裡的 ID 要保持「最近」，避免被淘汰後又被當成新 entry
+        if entry_id in self._ids:
+            self._ids.move_to_end(entry_id)
+
+    def to_list(self):
+        return list(self._ids)
+
+
+def _entry_time(entry):
+    return entry.get('published_parsed') or entry.get('updated_parsed')
+
+def _chronological(pairs):
+    # feed 通常是新 → 舊，先反轉；如果每個 entry 都有時間，再依時間穩定排序
+    pairs = list(reversed(pairs))
+    if pairs and all(_entry_time(entry) for _, entry in pairs):
+        pairs.sort(key=lambda pair: tuple(_entry_time(pair[1]))[:6])
+    return pairs
+
+def _identified(entries, entry_id_func):
+    pairs = []
+    ids = set()
+    for entry in entries:
+        entry_id = entry_id_func(entry)
+        if entry_id and entry_id not in ids: # 同一個 feed 內重複的 entry 只算一次
+            ids.add(entry_id)
+            pairs.append((entry_id, entry))
+    return pairs
+
+def bootstrap_seen(entries, entry_id_func, seen, last_id=None, since=None):
+    """第一次使用 seen set 時 (全新的 feed 或舊版只有 last_id 的狀態) 建立初始記錄。
+    舊版 last_id 之後 (較舊) 的 entry 視為已看過；找不到 last_id 但有 since (epoch 秒，補發時使用) 時，
+    發佈時間晚於 since 的 entry 都算新的；否則只把最新一則當成新的，
+    行為與舊版只比對 entries[0] 一致，不會一次灌進整個 feed"""
+    pairs = _identified(entries, entry_id_func)
+    seen.ensure_capacity(len(pairs))
+    ids = [entry_id for entry_id, _ in pairs]
+    if last_id and last_id in ids:
+        seen_ids = ids[ids.index(last_id):]
+    elif since is not None and pairs and all(_entry_time(entry) for _, entry in pairs):
+        seen_ids = [entry_id for entry_id, entry in pairs if calendar.timegm(_entry_time(entry)) <= since]
+    else:
+        seen_ids = ids[1:]
+    # 由舊到新加入，讓 LRU 的順序與 feed 一致
+    for entry_id in reversed(seen_ids):
+        seen.add(entry_id)
+    return seen
+
+def find_new_entries(entries, entry_id_func, seen):
+    """回傳 [(entry_id, entry), ...]，只包含 seen 裡沒有的 entry，依時間由舊到新排列"""
+    pairs = _identified(entries, entry_id_func)
+    seen.ensure_capacity(len(pairs))
+    new_pairs = []
+    for entry_id, entry in reversed(pairs):
+        if entry_id in seen:
+            seen.touch(entry_id)
+        else:
+            new_pairs.append((entry_id, entry))
+    new_pairs.reverse()
+    return _chronological(new_pairs)
+
+# --- END OF FILE seen_entries.py ---
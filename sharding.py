@@ -0,0 +1,437 @@
+# --- START OF FILE sharding.py ---
+# 多程序分片輪詢：
+#   - 協調者 (擁有 Discord 連線的主程序) 用一致性雜湊 (HashRing) 把每個 feed 分配給 N 個 worker 程序之一
+#   - worker 負責 CPU 密集的部分：下載、feedparser 解析、HTML 清理、時間戳解析、embed 渲染，
+#     把結果整理成精簡的 entry 記錄 (ID、時間、embed dict) 送回協調者，由協調者發送
+#   - seen set、validators、發送記錄都只存在協調者，worker 是無狀態的：
+#     worker 啟動 / 停止時只會改變「由誰抓取」，不會改變「什麼算新的」，所以重新分配不會遺失或重複通知
+#   - worker 斷線時，協調者把它從 ring 移除、把進行中的請求改送給新的負責者，並 (可選) 重新啟動它
+#
+# worker 是用 `python sharding.py --connect host:port --worker-id ...` 啟動的獨立程序，
+# 透過本機 TCP 連線 (長度前綴的 JSON 訊息) 與協調者溝通。連線後先以 token 回應協調者的隨機 challenge
+# (HMAC)，驗證通過之前協調者不會解析任何訊息；訊息大小也有上限。
+# 不用 multiprocessing 的 spawn，因為它會在每個子程序重新執行 main.py 的模組層級程式碼
+# (開啟狀態資料庫、建立 Bot)。
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import secrets
+import sys
+import time
+import traceback
+
+from multidict import CIMultiDict
+
+from dedup import entry_keys
+from feed_fetcher import FeedFetcher, FetchResult
+
+
+TOKEN_ENV = 'FEED_WORKER_TOKEN'
+MAX_FRAME_SIZE = 16 * 1024 * 1024   # 單一訊息的上限 (bytes)
+_NONCE_SIZE = 16
+_HANDSHAKE_TIMEOUT = 10
+
+# FetchResult 需要的回應標頭 (其他標頭不送回協調者)
+_FORWARDED_HEADERS = ('ETag', 'Last-Modified', 'Retry-After', 'Cache-Control', 'Content-Type')
+
+
+class WorkerLost(Exception):
+    """沒有可用的 worker，或處理請求的 worker 在回應之前就停止了"""
+
+
+class HashRing:
+    """一致性雜湊：加入或移除一個節點時，只有約 1/N 的 key 會換到別的節點"""
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self._points = []      # 排序過的 hash 值
+        self._owners = {}      # hash 值 -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def __len__(self):
+        return len(set(self._owners.values()))
+
+    def __contains__(self, node):
+        return node in self._owners.values()
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = self._hash(f'{node}#{i}')
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node):
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def get(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+# --- 訊息格式：4 bytes 長度 + UTF-8 JSON ---
+def _frame(message):
+    data = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return len(data).to_bytes(4, 'big') + data
+
+async def _receive(reader):
+    """讀取一則訊息；超過 MAX_FRAME_SIZE 或不是合法的 JSON 時拋出 ValueError"""
+    size = int.from_bytes(await reader.readexactly(4), 'big')
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit')
+    return json.loads(await reader.readexactly(size))
+
+def _auth_digest(token, nonce):
+    return hmac.new(token.encode('utf-8'), nonce, hashlib.sha256).digest()
+
+def _restore_record(record):
+    # JSON 沒有 struct_time，送回協調者後再轉回 feedparser 的格式
+    import feedparser
+    for key in ('published_parsed', 'updated_parsed'):
+        if record.get(key) is not None:
+            record[key] = time.struct_time(record[key])
+    return feedparser.FeedParserDict(record)
+
+
+# --- Worker 程序 ---
+def _normalize(source, handler, feed, known_ids, min_text_length):
+    """把解析好的 feed 整理成精簡的記錄 (只有 JSON 可以表示的型別)；已經看過的 entry 不渲染 embed"""
+    records = []
+    for entry in feed.entries:
+        entry_id = handler.entry_id(entry)
+        if not entry_id:
+            continue
+        published, updated = entry.get('published_parsed'), entry.get('updated_parsed')
+        record = dict(
+            id=entry_id,
+            title=entry.get('title'),
+            link=entry.get('link'),
+            published_parsed=list(published) if published else None,
+            updated_parsed=list(updated) if updated else None,
+            embed=None,
+            dedup_keys=[],
+        )
+        if entry_id not in known_ids:
+            record['dedup_keys'] = entry_keys(entry, min_text_length, text=handler.dedup_by_text)
+            try:
+                record['embed'] = handler.build_embed(source, feed, entry).to_dict()
+            except Exception as e:
+                print(f"[worker] Error rendering {source.label} entry {entry_id}: {e}")
+        records.append(record)
+    return records
+
+
+async def _poll_in_worker(fetcher, payload):
+    from feed_sources import FeedSource
+
+    source = FeedSource(payload['key'], payload['kind'], payload['url'], None,
+                        payload['interval'], label=payload['label'])
+    handler = source.handler
+    result = await fetcher.fetch(source.url, agent=handler.agent,
+                                 etag=payload['etag'], last_modified=payload['last_modified'])
+    response = {
+        'status': result.status,
+        'headers': {name: result.headers[name] for name in _FORWARDED_HEADERS if name in result.headers},
+        'body_size': result.body_size,
+        'error': str(result.error) if result.error is not None else None,
+        'fetch_time': result.fetch_time,
+        'parse_time': result.parse_time,
+        'ttl': None,
+        'records': None,
+    }
+    if result.feed is not None:
+        response['ttl'] = result.feed.feed.get('ttl')
+        response['records'] = _normalize(source, handler, result.feed, set(payload['known_ids']),
+                                         payload['dedup_min_text_length'])
+    return response
+
+
+async def run_worker(host, port, worker_id, token):
+    reader, writer = await asyncio.open_connection(host, port)
+    # 先回應協調者的 challenge，通過驗證後才開始交換訊息
+    nonce = await reader.readexactly(_NONCE_SIZE)
+    writer.write(_auth_digest(token, nonce))
+    writer.write(_frame(['hello', worker_id]))
+    kind, fetch_options = await _receive(reader)
+    fetcher = FeedFetcher(**fetch_options)
+    write_lock = asyncio.Lock()
+    in_flight = set()
+
+    async def handle(request_id, payload):
+        try:
+            response, error = await _poll_in_worker(fetcher, payload), None
+        except Exception as e:
+            traceback.print_exc()
+            response, error = None, f'{type(e).__name__}: {e}'
+        async with write_lock:
+            writer.write(_frame(['result', request_id, response, error]))
+            await writer.drain()
+
+    try:
+        while True:
+            try:
+                message = await _receive(reader)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                break   # 協調者已經關閉 (或訊息損壞)，沒有人會收結果了
+            if message[0] == 'stop':
+                # 正常停止：先把手上的請求處理完並回報
+                if in_flight:
+                    await asyncio.gather(*in_flight, return_exceptions=True)
+                break
+            task = asyncio.create_task(handle(message[1], message[2]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await fetcher.close()
+        writer.close()
+
+
+# --- 協調者 ---
+class _Worker:
+    def __init__(self, worker_id, writer):
+        self.worker_id = worker_id
+        self.writer = writer
+        self.pending = set()         # 送到這個 worker、還沒有回應的 request_id
+
+
+class ShardPool:
+    def __init__(self, workers=2, fetch_options=None, restart=True, host='127.0.0.1', port=0, replicas=64,
+                 dedup_min_text_length=20):
+        self.worker_count = workers
+        self.fetch_options = fetch_options or {}
+        self.dedup_min_text_length = dedup_min_text_length
+        self.restart = restart       # worker 意外結束時自動補上一個新的
+        self.host = host
+        self.port = port             # 0 表示由系統分配
+        self.token = secrets.token_hex(16)
+        self._ring = HashRing(replicas=replicas)
+        self._workers = {}           # worker_id -> _Worker (已連線)
+        self._processes = {}         # worker_id -> asyncio.subprocess.Process (由這裡啟動的)
+        self._retiring = set()       # 正在正常停止的 worker
+        self._connected = {}         # worker_id -> asyncio.Event
+        self._requests = {}          # request_id -> (future, payload)
+        self._request_ids = itertools.count(1)
+        self._worker_ids = itertools.count(0)
+        self._watchers = set()       # 監看 worker 程序結束的 task (保留參照，stop 時取消)
+        self._server = None
+        self._stopping = False
+
+    @property
+    def workers(self):
+        return list(self._workers)
+
+    # --- 生命週期 ---
+    def is_running(self):
+        return self._server is not None
+
+    async def start(self, connect_timeout=30):
+        if self.is_running():
+            return
+        self._stopping = False
+        self._server = await asyncio.start_server(self._handle_worker, self.host, self.port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        worker_ids = [await self.spawn_worker() for _ in range(self.worker_count)]
+        # 等 worker 連上再開始輪詢；逾時的 worker 之後連上時也會自動加入
+        try:
+            await asyncio.wait_for(asyncio.gather(*(self._connected[worker_id].wait() for worker_id in worker_ids)),
+                                   timeout=connect_timeout)
+        except asyncio.TimeoutError:
+            print(f"Only {len(self._workers)} of {len(worker_ids)} feed workers connected within {connect_timeout}s.")
+        print(f"Feed worker pool listening on {self.host}:{self.port} with {len(self._workers)} workers.")
+
+    async def stop(self):
+        if not self.is_running():
+            return
+        self._stopping = True
+        for worker_id in list(self._processes):
+            await self.remove_worker(worker_id)
+        for worker in list(self._workers.values()):
+            worker.writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        for future, _ in self._requests.values():
+            if not future.done():
+                future.set_exception(WorkerLost('feed worker pool stopped'))
+        self._requests = {}
+        for task in list(self._watchers):
+            task.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        self._watchers.clear()
+
+    # --- 加入 / 移除 worker (重新分配) ---
+    async def spawn_worker(self):
+        """啟動一個新的 worker 程序；連上之後加入 ring，原本屬於其他 worker 的約 1/N 的 feed 會改由它抓取"""
+        worker_id = f'worker-{os.getpid()}-{next(self._worker_ids)}'
+        self._connected[worker_id] = asyncio.Event()
+        env = dict(os.environ, **{TOKEN_ENV: self.token})
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            '--connect', f'{self.host}:{self.port}', '--worker-id', worker_id, env=env)
+        self._processes[worker_id] = process
+        task = asyncio.create_task(self._watch_process(worker_id, process), name=f'watch-{worker_id}')
+        self._watchers.add(task)
+        task.add_done_callback(self._watchers.discard)
+        return worker_id
+
+    async def remove_worker(self, worker_id, timeout=30):
+        """先從 ring 移除 (新的請求改送到其他 worker)，等 worker 處理完手上的請求後再結束程序"""
+        self._retiring.add(worker_id)
+        self._ring.remove(worker_id)
+        worker = self._workers.get(worker_id)
+        if worker is not None:
+            worker.writer.write(_frame(['stop']))
+        process = self._processes.get(worker_id)
+        if process is not None and process.returncode is None:
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+    def owner_of(self, feed_key):
+        return self._ring.get(feed_key)
+
+    # --- 對外介面 ---
+    async def fetch(self, source, state):
+        """在負責這個 feed 的 worker 抓取並渲染，回傳 FetchResult
+        (feed.entries 是精簡過的記錄，每筆有 id / title / link / 時間 / embed dict)"""
+        payload = {
+            'key': source.key,
+            'kind': source.kind,
+            'url': source.url,
+            'label': source.label,
+            'interval': source.interval,
+            'etag': state.etag,
+            'last_modified': state.last_modified,
+            'known_ids': list(state.seen) if state.seen_initialized else [],
+            'dedup_min_text_length': self.dedup_min_text_length,
+        }
+        future = asyncio.get_running_loop().create_future()
+        request_id = next(self._request_ids)
+        self._requests[request_id] = (future, payload)
+        self._submit(request_id)
+        response = await future
+        feed = None
+        if response['records'] is not None:
+            import feedparser
+            feed = feedparser.FeedParserDict(
+                feed=feedparser.FeedParserDict({'ttl': response['ttl']} if response['ttl'] else {}),
+                entries=[_restore_record(record) for record in response['records']])
+        return FetchResult(payload['url'], status=response['status'], feed=feed,
+                           headers=CIMultiDict(response['headers']), body_size=response['body_size'],
+                           error=response['error'], fetch_time=response['fetch_time'],
+                           parse_time=response['parse_time'])
+
+    # --- 內部 ---
+    def _submit(self, request_id):
+        future, payload = self._requests[request_id]
+        worker = self._workers.get(self._ring.get(payload['key']))
+        if worker is None:
+            self._requests.pop(request_id, None)
+            if not future.done():
+                future.set_exception(WorkerLost('no feed worker available'))
+            return
+        worker.pending.add(request_id)
+        worker.writer.write(_frame(['poll', request_id, payload]))
+
+    async def _handle_worker(self, reader, writer):
+        # 驗證之前只讀取固定長度的原始 bytes，不解析任何訊息
+        nonce = secrets.token_bytes(_NONCE_SIZE)
+        try:
+            writer.write(nonce)
+            digest = await asyncio.wait_for(reader.readexactly(hashlib.sha256().digest_size), _HANDSHAKE_TIMEOUT)
+            authenticated = hmac.compare_digest(digest, _auth_digest(self.token, nonce))
+            if authenticated and not self._stopping:
+                kind, worker_id = await asyncio.wait_for(_receive(reader), _HANDSHAKE_TIMEOUT)
+        except Exception:
+            authenticated = False
+        if not authenticated or self._stopping or kind != 'hello' or not isinstance(worker_id, str):
+            writer.close()
+            return
+        writer.write(_frame(['config', self.fetch_options]))
+        worker = self._workers[worker_id] = _Worker(worker_id, writer)
+        if worker_id not in self._retiring:
+            self._ring.add(worker_id)
+        self._connected.setdefault(worker_id, asyncio.Event()).set()
+        print(f"Feed worker {worker_id} connected ({len(self._workers)} active).")
+        try:
+            while True:
+                kind, request_id, response, error = await _receive(reader)
+                self._on_result(worker, request_id, response, error)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, TypeError) as e:
+            print(f"Invalid message from feed worker {worker_id}: {e}")
+        finally:
+            writer.close()
+            self._on_disconnect(worker)
+
+    def _on_result(self, worker, request_id, response, error):
+        worker.pending.discard(request_id)
+        entry = self._requests.pop(request_id, None)
+        if entry is None or entry[0].done():
+            return
+        if error is not None:
+            entry[0].set_exception(RuntimeError(f'{worker.worker_id}: {error}'))
+        else:
+            entry[0].set_result(response)
+
+    def _on_disconnect(self, worker):
+        self._workers.pop(worker.worker_id, None)
+        self._ring.remove(worker.worker_id)
+        self._connected.pop(worker.worker_id, None)
+        if not self._stopping:
+            print(f"Feed worker {worker.worker_id} disconnected ({len(self._workers)} active).")
+        # 還沒有回應的請求改送給現在負責這些 feed 的 worker。
+        # seen set 只在協調者，同一份 feed 就算被抓兩次也只會通知一次
+        for request_id in list(worker.pending):
+            if request_id in self._requests:
+                self._submit(request_id)
+        worker.pending.clear()
+
+    async def _watch_process(self, worker_id, process):
+        await process.wait()
+        self._processes.pop(worker_id, None)
+        retired = worker_id in self._retiring
+        self._retiring.discard(worker_id)
+        if retired or self._stopping:
+            return
+        print(f"Feed worker {worker_id} exited unexpectedly (exit code {process.returncode}).")
+        if self.restart:
+            await self.spawn_worker()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Feed worker process (started by ShardPool)')
+    parser.add_argument('--connect', required=True, help='協調者的 host:port')
+    parser.add_argument('--worker-id', required=True)
+    args = parser.parse_args(argv)
+    host, port = args.connect.rsplit(':', 1)
+    token = os.environ.get(TOKEN_ENV, '')
+    try:
+        asyncio.run(run_worker(host, int(port), args.worker_id, token))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
+
+# --- END OF FILE sharding.py ---
@@ -0,0 +1,344 @@
+# --- START OF FILE state_store.py ---
+# 所有 feed 狀態集中存放在一個 SQLite (WAL 模式) 資料庫：
+#   - last ID、seen set、high-water mark、HTTP validators (ETag / Last-Modified)、發送記錄、webhook URL
+#   - 啟動時一次載入到記憶體，輪詢時只修改記憶體中的狀態
+#   - 寫入以 transaction 批次進行 (同一輪詢週期內的變更合併成一次 commit)，不會寫到一半損壞
+#   - 第一次啟動時自動從舊版的 *_latest.json / *_validators.json 遷移
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from seen_entries import SeenSet
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feed_state (
+    feed_key      TEXT PRIMARY KEY,
+    last_id       TEXT NOT NULL DEFAULT '',
+    seen          TEXT,              -- JSON list，NULL 表示 seen set 尚未建立
+    etag          TEXT,
+    last_modified TEXT,
+    updated_at    REAL NOT NULL,
+    high_water    REAL               -- 已處理的 entry 中最新的發佈時間 (epoch 秒)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    feed_key     TEXT NOT NULL,
+    entry_id     TEXT NOT NULL,
+    channel_id   INTEGER NOT NULL,
+    delivered_at REAL NOT NULL,
+    PRIMARY KEY (feed_key, entry_id, channel_id)
+);
+CREATE TABLE IF NOT EXISTS webhooks (
+    channel_id INTEGER PRIMARY KEY,
+    url        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class FeedState:
+    """單一 feed 在記憶體中的狀態"""
+
+    def __init__(self, feed_key, last_id='', seen_ids=None, etag=None, last_modified=None, seen_capacity=500,
+                 high_water=None):
+        self.feed_key = feed_key
+        self.last_id = last_id or ''
+        self.high_water = high_water      # 已處理的 entry 中最新的發佈時間 (epoch 秒)，補發時用來判斷錯過了哪些
+        # seen_ids 為 None 代表舊版狀態或全新的 feed，需要先 bootstrap
+        self.seen_initialized = seen_ids is not None
+        self.seen = SeenSet(seen_ids or (), capacity=seen_capacity)
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def advance_high_water(self, timestamp):
+        """回傳 high-water mark 是否前進"""
+        if timestamp is not None and (self.high_water is None or timestamp > self.high_water):
+            self.high_water = timestamp
+            return True
+        return False
+
+    def set_validators(self, result):
+        self.etag = result.etag
+        self.last_modified = result.last_modified
+
+
+class StateStore:
+    def __init__(self, path, seen_capacity=500, delivery_retention=7 * 24 * 3600):
+        self.path = path
+        self.seen_capacity = seen_capacity
+        self.delivery_retention = delivery_retention  # 發送記錄保留多久 (秒)
+        self._conn = None
+        self._lock = threading.Lock()
+        self._states = {}
+        self._deliveries = {}             # (feed_key, entry_id, channel_id) -> delivered_at，依時間排序
+        self._dirty = set()
+        self._pending_deliveries = []
+        self._webhook_urls = {}           # channel_id -> webhook URL
+        self._flush_handle = None
+        self._flush_writing = False   # 排定的 flush 已經開始寫入 (不能再取消)
+        self.last_active = None           # 上次執行時最後一次寫入的時間 (epoch 秒)；全新的資料庫為 None
+
+    # --- 開啟 / 載入 ---
+    def open(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(feed_state)')}
+        if 'high_water' not in columns:
+            # 舊版資料庫沒有 high-water mark
+            self._conn.execute('ALTER TABLE feed_state ADD COLUMN high_water REAL')
+        return self
+
+    def load(self):
+        """在同一個 transaction 中一次把所有 feed 狀態、近期的發送記錄與 webhook URL 讀進記憶體"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                cutoff = time.time() - self.delivery_retention
+                self._conn.execute('DELETE FROM deliveries WHERE delivered_at < ?', (cutoff,))
+                rows = self._conn.execute(
+                    'SELECT feed_key, last_id, seen, etag, last_modified, high_water FROM feed_state').fetchall()
+                deliveries = self._conn.execute(
+                    'SELECT feed_key, entry_id, channel_id, delivered_at FROM deliveries ORDER BY delivered_at').fetchall()
+                webhook_urls = self._conn.execute('SELECT channel_id, url FROM webhooks').fetchall()
+                last_active = self._conn.execute("SELECT value FROM meta WHERE key = 'last_active'").fetchone()
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        # JSON 解碼與建立物件不需要佔用資料庫
+        for feed_key, last_id, seen, etag, last_modified, high_water in rows:
+            seen_ids = json.loads(seen) if seen is not None else None
+            self._states[feed_key] = FeedState(feed_key, last_id, seen_ids, etag, last_modified,
+                                               seen_capacity=self.seen_capacity, high_water=high_water)
+        self._deliveries = {tuple(row[:3]): row[3] for row in deliveries}
+        self._webhook_urls = dict(webhook_urls)
+        self.last_active = float(last_active[0]) if last_active else None
+        print(f"Loaded state for {len(self._states)} feeds from {self.path}")
+        return self
+
+    def close(self):
+        self.flush_sync()
+        # 在 lock 之內關閉，其他執行緒中進行中的寫入會先完成
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_active', ?)",
+                                   (str(time.time()),))
+                self._conn.close()
+                self._conn = None
+
+    async def aclose(self):
+        """在 event loop 中關閉：還在等待的 flush 取消 (變更由 close 一併寫入)，已經開始寫入的等它完成"""
+        handle = self._flush_handle
+        if handle is not None and not handle.done():
+            if not self._flush_writing:
+                handle.cancel()
+            try:
+                await handle
+            except asyncio.CancelledError:
+                pass
+        self._flush_handle = None
+        self.close()
+
+    # --- 狀態存取 ---
+    def get(self, feed_key):
+        state = self._states.get(feed_key)
+        if state is None:
+            state = self._states[feed_key] = FeedState(feed_key, seen_capacity=self.seen_capacity)
+        return state
+
+    def reset(self, feed_key):
+        """丟掉一個 feed 的狀態 (例如 URL 換成另一個 feed)，下一次輪詢會重新 bootstrap seen set"""
+        state = self._states[feed_key] = FeedState(feed_key, seen_capacity=self.seen_capacity)
+        self.mark_dirty(feed_key)
+        return state
+
+    def mark_dirty(self, feed_key):
+        self._dirty.add(feed_key)
+
+    def has_delivery(self, feed_key, entry_id, channel_id):
+        return (feed_key, entry_id, channel_id) in self._deliveries
+
+    def record_delivery(self, feed_key, entry_id, channel_id):
+        record = (feed_key, entry_id, channel_id)
+        if record not in self._deliveries:
+            delivered_at = time.time()
+            self._deliveries[record] = delivered_at
+            self._pending_deliveries.append(record + (delivered_at,))
+
+    # --- Webhook URL (很少變動，直接寫入) ---
+    def get_webhook_url(self, channel_id):
+        return self._webhook_urls.get(channel_id)
+
+    def set_webhook_url(self, channel_id, url):
+        self._webhook_urls[channel_id] = url
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO webhooks (channel_id, url) VALUES (?, ?)', (channel_id, url))
+
+    def remove_webhook_url(self, channel_id):
+        if self._webhook_urls.pop(channel_id, None) is not None:
+            with self._lock:
+                self._conn.execute('DELETE FROM webhooks WHERE channel_id = ?', (channel_id,))
+
+    # --- 寫入 ---
+    def _collect_changes(self):
+        # 必須在 event loop 的執行緒中呼叫：在這裡把記憶體狀態複製成資料列，
+        # 之後寫入資料庫時 (可能在其他執行緒) 就不會與輪詢同時修改到同一份資料
+        dirty, self._dirty = self._dirty, set()
+        deliveries, self._pending_deliveries = self._pending_deliveries, []
+        now = time.time()
+        rows = []
+        for feed_key in dirty:
+            state = self._states.get(feed_key)
+            if state is None:
+                continue
+            seen = json.dumps(state.seen.to_list(), ensure_ascii=False) if state.seen_initialized else None
+            rows.append((feed_key, state.last_id, seen, state.etag, state.last_modified, now, state.high_water))
+        return dirty, rows, deliveries, self._prune_deliveries(now - self.delivery_retention)
+
+    def _prune_deliveries(self, cutoff):
+        """從記憶體移除早於 cutoff 的發送記錄；有移除時回傳 cutoff (資料庫也要刪除)，否則回傳 None"""
+        pruned = False
+        # dict 依寫入順序 (也就是時間順序) 排列，只需要從最舊的開始檢查
+        while self._deliveries:
+            record, delivered_at = next(iter(self._deliveries.items()))
+            if delivered_at >= cutoff:
+                break
+            del self._deliveries[record]
+            pruned = True
+        return cutoff if pruned else None
+
+    def _write_changes(self, dirty, rows, deliveries, prune_before=None):
+        """把所有變更在同一個 transaction 中寫入資料庫"""
+        with self._lock:
+            if self._conn is None:
+                print(f"CRITICAL: Feed state store {self.path} is already closed; {len(rows)} changes not written.")
+                return False
+            try:
+                self._conn.execute('BEGIN')
+                self._conn.executemany(
+                    'INSERT INTO feed_state (feed_key, last_id, seen, etag, last_modified, updated_at, high_water) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(feed_key) DO UPDATE SET last_id=excluded.last_id, seen=excluded.seen, '
+                    'etag=excluded.etag, last_modified=excluded.last_modified, updated_at=excluded.updated_at, '
+                    'high_water=excluded.high_water',
+                    rows)
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO deliveries (feed_key, entry_id, channel_id, delivered_at) '
+                    'VALUES (?, ?, ?, ?)', deliveries)
+                if prune_before is not None:
+                    self._conn.execute('DELETE FROM deliveries WHERE delivered_at < ?', (prune_before,))
+                # 記錄最後一次寫入的時間，下次啟動時可以知道停機了多久
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_active', ?)",
+                                   (str(time.time()),))
+                self._conn.execute('COMMIT')
+                return True
+            except Exception as e:
+                self._conn.execute('ROLLBACK')
+                print(f"CRITICAL: Failed to write feed state to {self.path}: {e}")
+                return False
+
+    def _requeue(self, dirty, deliveries):
+        # 寫入失敗時保留變更，下一次 flush 再試
+        self._dirty |= dirty
+        self._pending_deliveries = deliveries + self._pending_deliveries
+
+    def flush_sync(self):
+        if self._conn is None or (not self._dirty and not self._pending_deliveries):
+            return
+        dirty, rows, deliveries, prune_before = self._collect_changes()
+        if not self._write_changes(dirty, rows, deliveries, prune_before):
+            self._requeue(dirty, deliveries)
+
+    async def flush(self):
+        if self._conn is None or (not self._dirty and not self._pending_deliveries):
+            return
+        dirty, rows, deliveries, prune_before = self._collect_changes()
+        if not await asyncio.to_thread(self._write_changes, dirty, rows, deliveries, prune_before):
+            self._requeue(dirty, deliveries)
+
+    def schedule_flush(self, delay=1.0):
+        """在 delay 秒後 flush；期間其他 feed 的變更會合併到同一次寫入"""
+        if self._flush_handle is not None and not self._flush_handle.done():
+            return
+        async def _delayed_flush():
+            await asyncio.sleep(delay)
+            self._flush_writing = True
+            try:
+                await self.flush()
+            finally:
+                self._flush_writing = False
+        self._flush_handle = asyncio.create_task(_delayed_flush(), name='state-flush')
+
+    # --- 舊版 JSON 狀態遷移 ---
+    def migrate_legacy_json(self, sources):
+        """把舊版 data/*_latest.json 與 *_validators.json 匯入資料庫 (只做一次)，
+        匯入後把舊檔案改名為 *.migrated"""
+        legacy = [source for source in sources
+                  if os.path.exists(source.state_path) or os.path.exists(validators_path_for(source.state_path))]
+        if not legacy:
+            # 已經遷移過 (或從來沒有舊檔案)：不需要額外查詢資料庫
+            return
+        migrated = 0
+        existing = self._existing_keys()
+        for source in legacy:
+            if source.key in existing:
+                continue
+            legacy_path = source.state_path
+            validators_path = validators_path_for(legacy_path)
+            data = _read_legacy_json(legacy_path)
+            validators = _read_legacy_json(validators_path)
+            last_id = data.get(source.handler.id_key) or ''
+            seen_ids = data.get('seen') if isinstance(data.get('seen'), list) else None
+            state = FeedState(source.key, last_id, seen_ids,
+                              validators.get('etag') or None, validators.get('last_modified') or None,
+                              seen_capacity=self.seen_capacity)
+            self._states[source.key] = state
+            self.mark_dirty(source.key)
+            migrated += 1
+        self.flush_sync()
+        # 只有確定已寫進資料庫的 feed 才把舊檔案改名
+        existing = self._existing_keys()
+        for source in legacy:
+            if source.key not in existing:
+                continue
+            for path in (source.state_path, validators_path_for(source.state_path)):
+                if os.path.exists(path):
+                    os.replace(path, path + '.migrated')
+        if migrated:
+            print(f"Migrated {migrated} legacy JSON state files into {self.path}")
+
+    def _existing_keys(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute('SELECT feed_key FROM feed_state')}
+
+
+# 舊版驗證資訊存放在 *_latest.json 旁邊的 *_validators.json
+def validators_path_for(filepath):
+    base = filepath[:-len('_latest.json')] if filepath.endswith('_latest.json') else os.path.splitext(filepath)[0]
+    return f"{base}_validators.json"
+
+def _read_legacy_json(filepath):
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+            data = json.loads(content) if content else {}
+            return data if isinstance(data, dict) else {}
+    except (json.JSONDecodeError, OSError) as e:
+        print(f'Warning: Could not read legacy state file {filepath}: {e}. Skipping.')
+        return {}
+
+# --- END OF FILE state_store.py ---
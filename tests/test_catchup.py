@@ -0,0 +1,48 @@
+# --- START OF FILE tests/test_catchup.py ---
+import unittest
+
+from catchup import PendingEntry, merge_chronological, plan_channel
+from feed_sources import FeedSource
+
+
+def _source(key):
+    return FeedSource(key, 'twitter', f'https://rss.app/feeds/{key}.xml', None, 300, label=key)
+
+def _pending(source, count, start=0, step=60):
+    return [PendingEntry(source, f'{source.key}-{i}', None, start + i * step,
+                         title=f'post {i}', link=f'https://x.com/{source.key}/status/{i}')
+            for i in range(count)]
+
+
+class PlanChannelTest(unittest.TestCase):
+    def test_few_entries_are_sent_individually(self):
+        entries = merge_chronological([_pending(_source('a'), 2), _pending(_source('b'), 2, start=30)])
+        messages = plan_channel(entries, digest_threshold=5)
+        self.assertEqual([message.message_id for message in messages], ['a-0', 'b-0', 'a-1', 'b-1'])
+
+    def test_busiest_feed_is_digested_first(self):
+        busy, quiet = _source('busy'), _source('quiet')
+        entries = merge_chronological([_pending(busy, 11), _pending(quiet, 2, start=5)])
+        messages = plan_channel(entries, digest_threshold=5, digest_size=10)
+        digests = [message for message in messages if len(message.entries) > 1]
+        # 11 則平均分成 6 + 5，另一個 feed 仍然逐則發送
+        self.assertEqual([len(message.entries) for message in digests], [6, 5])
+        self.assertTrue(all(message.source is busy for message in digests))
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(digests[0].message_id, 'digest:busy-0..busy-5')
+
+    def test_messages_stay_in_chronological_order(self):
+        entries = merge_chronological([_pending(_source('a'), 8, start=0), _pending(_source('b'), 3, start=100)])
+        messages = plan_channel(entries, digest_threshold=3, digest_size=10)
+        keys = [message.sort_key for message in messages]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_zero_threshold_disables_digests(self):
+        entries = _pending(_source('a'), 20)
+        self.assertEqual(len(plan_channel(entries, digest_threshold=0)), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_catchup.py ---
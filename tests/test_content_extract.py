@@ -0,0 +1,53 @@
+# --- START OF FILE tests/test_content_extract.py ---
+import unittest
+
+from content_extract import extract_content
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+# 舊版以 BeautifulSoup 處理時容易出現差異的輸入
+EDGE_CASES = [
+    '<p>Hello <b>world</b></p><img src="a.jpg"><img src="b.jpg">',
+    'AT&T &amp; friends &foo; &#150; &#x41; &copy',
+    '<script>var x = 1;</script><style>p{}</style>visible',
+    '<![CDATA[raw <text>]]> after',
+    '<!-- comment -->before<br/>after',
+    '<a href="http://x">link <i>text</i></a> tail',
+    'plain text only',
+    '<img src="" /><img src="c.png"/>',
+    '<div>  spaced\n\n  text </div><p>&nbsp;</p>',
+    '<p>unclosed <b>bold',
+]
+
+
+class ExtractContentTest(unittest.TestCase):
+    def test_text_image_and_links(self):
+        content = extract_content('<p>Hi <a href="https://t.co/x">there</a></p><img src="a.jpg"><img src="b.jpg">')
+        self.assertEqual(content.text, 'Hi there')
+        self.assertEqual(content.image_url, 'a.jpg')
+        self.assertEqual(content.links, [('https://t.co/x', 'there')])
+
+    def test_empty_input(self):
+        content = extract_content('')
+        self.assertEqual((content.text, content.image_url, content.links), ('', None, []))
+
+    @unittest.skipIf(BeautifulSoup is None, 'beautifulsoup4 is not installed')
+    def test_matches_beautifulsoup(self):
+        for raw_html in EDGE_CASES:
+            with self.subTest(raw_html=raw_html):
+                soup = BeautifulSoup(raw_html, 'html.parser')
+                img = soup.find('img')
+                content = extract_content(raw_html)
+                self.assertEqual(content.text, soup.get_text(separator=' ', strip=True))
+                # 空的 src 舊版同樣視為沒有圖片
+                self.assertEqual(content.image_url, (img.get('src') if img else None) or None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_content_extract.py ---
@@ -0,0 +1,43 @@
+# --- START OF FILE tests/test_dedup.py ---
+import unittest
+
+from dedup import DedupIndex, entry_keys
+
+
+BOILERPLATE = '<p>Subscribe to the channel for more videos every week! Follow us on social media.</p>'
+
+
+def _video(video_id):
+    return {'link': f'https://www.youtube.com/watch?v={video_id}', 'title': video_id, 'summary': BOILERPLATE}
+
+
+class DedupIndexTest(unittest.TestCase):
+    def test_same_feed_entries_sharing_boilerplate_are_not_duplicates(self):
+        index = DedupIndex()
+        first = entry_keys(_video('AAA'))
+        second = entry_keys(_video('BBB'))
+        self.assertEqual(first[1], second[1])   # 同樣的樣板說明 → 同樣的內文指紋
+
+        self.assertEqual(index.claim('youtube:a', 'AAA', first, [1]), {})
+        self.assertEqual(index.claim('youtube:a', 'BBB', second, [1]), {})
+        self.assertEqual(index.coalesced, 0)
+
+    def test_same_content_from_another_feed_is_a_duplicate(self):
+        index = DedupIndex()
+        tweet = {'link': 'https://x.com/alice/status/123', 'summary': 'hello'}
+        retweet = {'link': 'https://twitter.com/bob/status/123?s=20', 'summary': 'hello'}
+
+        self.assertEqual(index.claim('twitter:alice', '123', entry_keys(tweet), [1, 2]), {})
+        duplicates = index.claim('twitter:bob', '123', entry_keys(retweet), [2, 3])
+        self.assertEqual(duplicates, {2: ('twitter:alice', '123')})
+        self.assertEqual(index.coalesced, 1)
+
+    def test_text_fingerprint_can_be_disabled(self):
+        keys = entry_keys(_video('AAA'), text=False)
+        self.assertEqual(keys, ['url:youtube.com/watch?v=AAA'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_dedup.py ---
@@ -0,0 +1,37 @@
+# --- START OF FILE tests/test_feed_config.py ---
+import unittest
+
+from feed_config import validate_feed_config
+
+
+class ValidateFeedConfigTest(unittest.TestCase):
+    def test_accepts_urls_and_feed_objects(self):
+        validate_feed_config({
+            'check_interval': 300,
+            'youtube_rss': 'https://www.youtube.com/feeds/videos.xml?channel_id=x',
+            'instagram_rss': {'url': 'https://rss.app/feeds/a.xml', 'interval': 600},
+            'twitter_rss': ['https://rss.app/feeds/b.xml', {'url': 'https://rss.app/feeds/c.xml', 'channel_ids': [123, '456']}],
+            'twitter_channel_ids': [],
+            'twitter_channel_name': 'sns',
+        })
+
+    def test_rejects_malformed_feeds(self):
+        invalid = [
+            {'twitter_rss': [{'interval': 60}]},
+            {'twitter_rss': [{'url': 'u', 'channel_ids': ['#sns']}]},
+            {'twitter_rss': [{'url': 'u', 'interval': 0}]},
+            {'twitter_rss': 'https://rss.app/feeds/b.xml'},
+            {'instagram_rss': {'url': 'u', 'interval': '60'}},
+            {'youtube_channel_ids': '123'},
+            {'check_interval': -1},
+            {'unknown': 1},
+        ]
+        for values in invalid:
+            with self.subTest(values=values), self.assertRaises(ValueError):
+                validate_feed_config(values)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_feed_config.py ---
@@ -0,0 +1,47 @@
+# --- START OF FILE tests/test_poll_scheduler.py ---
+import unittest
+
+from poll_scheduler import AdaptivePolicy, PollOutcome, PollScheduler
+
+
+class _Source:
+    def __init__(self, key='feed', interval=300, min_interval=None):
+        self.key = key
+        self.interval = interval
+        self.min_interval = min_interval
+
+
+class AdaptivePolicyTest(unittest.TestCase):
+    def test_active_feed_polls_a_fraction_of_the_post_gap(self):
+        policy = AdaptivePolicy(min_interval=60, max_interval=3600, polls_per_post=4)
+        outcome = PollOutcome(changed=True, entry_times=[0, 1200, 2400, 3600])
+        self.assertEqual(policy.next_interval(_Source(), outcome), 300)
+
+    def test_idle_and_failing_feeds_back_off_up_to_max_interval(self):
+        policy = AdaptivePolicy(min_interval=60, max_interval=3600, backoff_factor=2.0, error_backoff_factor=2.0)
+        source = _Source(interval=300)
+        self.assertEqual(policy.next_interval(source, PollOutcome()), 600)
+        self.assertEqual(policy.next_interval(source, PollOutcome()), 1200)
+        self.assertEqual(policy.next_interval(source, PollOutcome(changed=True)), 300)
+        self.assertEqual(policy.next_interval(source, PollOutcome(error=True)), 600)
+        for _ in range(5000):
+            interval = policy.next_interval(source, PollOutcome(error=True))
+        self.assertEqual(interval, 3600)
+        self.assertLess(policy._cadence[source.key].errors, 10)   # 計數不會無限增加 (次方運算溢位)
+
+    def test_server_min_delay_overrides_max_interval(self):
+        policy = AdaptivePolicy(max_interval=3600)
+        self.assertEqual(policy.next_interval(_Source(), PollOutcome(rate_limited=True, min_delay=7200)), 7200)
+
+
+class SchedulerIntervalTest(unittest.TestCase):
+    def test_min_delay_applies_without_a_policy(self):
+        scheduler = PollScheduler(None, jitter=0.1, policy=None)
+        self.assertEqual(scheduler._next_interval(_Source(interval=60), PollOutcome(min_delay=900)), 900)
+        self.assertLessEqual(scheduler._next_interval(_Source(interval=60), PollOutcome()), 66)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_poll_scheduler.py ---
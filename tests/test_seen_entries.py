@@ -0,0 +1,66 @@
+# --- START OF FILE tests/test_seen_entries.py ---
+import calendar
+import time
+import unittest
+
+from seen_entries import SeenSet, bootstrap_seen, find_new_entries
+
+
+def _entry(entry_id, day=None):
+    entry = {'id': entry_id}
+    if day is not None:
+        entry['published_parsed'] = time.struct_time((2024, 1, day, 12, 0, 0, 0, day, 0))
+    return entry
+
+def _ids(pairs):
+    return [entry_id for entry_id, _ in pairs]
+
+def entry_id(entry):
+    return entry['id']
+
+
+class BootstrapSeenTest(unittest.TestCase):
+    def test_new_feed_notifies_only_the_newest_entry(self):
+        entries = [_entry('c'), _entry('b'), _entry('a')]   # feed 是新 → 舊
+        seen = bootstrap_seen(entries, entry_id, SeenSet())
+        self.assertEqual(sorted(seen), ['a', 'b'])
+
+    def test_entries_after_legacy_last_id_are_new(self):
+        entries = [_entry('d'), _entry('c'), _entry('b'), _entry('a')]
+        seen = bootstrap_seen(entries, entry_id, SeenSet(), last_id='b')
+        self.assertEqual(sorted(seen), ['a', 'b'])
+
+    def test_since_marks_entries_published_later_as_new(self):
+        entries = [_entry('c', 3), _entry('b', 2), _entry('a', 1)]
+        since = calendar.timegm((2024, 1, 2, 0, 0, 0))
+        seen = bootstrap_seen(entries, entry_id, SeenSet(), since=since)
+        self.assertEqual(sorted(seen), ['a'])
+
+
+class FindNewEntriesTest(unittest.TestCase):
+    def test_returns_every_unseen_entry_oldest_first(self):
+        entries = [_entry('d', 4), _entry('c', 3), _entry('b', 2), _entry('a', 1)]
+        seen = SeenSet(['a'])
+        self.assertEqual(_ids(find_new_entries(entries, entry_id, seen)), ['b', 'c', 'd'])
+
+    def test_sorts_by_published_time_when_available(self):
+        entries = [_entry('b', 2), _entry('c', 3), _entry('a', 1)]   # 置頂的貼文不在最前面
+        self.assertEqual(_ids(find_new_entries(entries, entry_id, SeenSet())), ['a', 'b', 'c'])
+
+    def test_duplicates_and_missing_ids_are_ignored(self):
+        entries = [_entry('b'), _entry('b'), _entry(None), _entry('a')]
+        self.assertEqual(_ids(find_new_entries(entries, entry_id, SeenSet())), ['a', 'b'])
+
+    def test_ids_still_in_the_feed_are_not_evicted(self):
+        seen = SeenSet(['a', 'b'], capacity=2)
+        entries = [_entry('c'), _entry('b'), _entry('a')]
+        self.assertEqual(_ids(find_new_entries(entries, entry_id, seen)), ['c'])
+        self.assertGreaterEqual(seen.capacity, 3)
+        seen.add('c')
+        self.assertEqual(sorted(seen), ['a', 'b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_seen_entries.py ---
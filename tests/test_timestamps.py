@@ -0,0 +1,54 @@
+# --- START OF FILE tests/test_timestamps.py ---
+import datetime
+import os
+import time
+import unittest
+
+from timestamps import entry_epoch, parse_timestamp, struct_to_datetime
+
+
+UTC = datetime.timezone.utc
+
+
+class StructToDatetimeTest(unittest.TestCase):
+    def test_struct_time_is_treated_as_utc(self):
+        struct = time.struct_time((2021, 9, 6, 16, 45, 0, 0, 249, 0))
+        self.assertEqual(struct_to_datetime(struct), datetime.datetime(2021, 9, 6, 16, 45, tzinfo=UTC))
+
+    @unittest.skipUnless(hasattr(time, 'tzset'), 'time.tzset is not available')
+    def test_result_does_not_depend_on_the_host_timezone(self):
+        struct = time.struct_time((2021, 9, 6, 16, 45, 0, 0, 249, 0))
+        original = os.environ.get('TZ')
+        try:
+            os.environ['TZ'] = 'Asia/Taipei'
+            time.tzset()
+            self.assertEqual(struct_to_datetime(struct).timestamp(), 1630946700)
+        finally:
+            if original is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = original
+            time.tzset()
+
+    def test_entry_epoch(self):
+        struct = time.struct_time((2021, 9, 6, 16, 45, 0, 0, 249, 0))
+        self.assertEqual(entry_epoch({'updated_parsed': struct}), 1630946700)
+        self.assertIsNone(entry_epoch({}))
+
+
+class ParseTimestampTest(unittest.TestCase):
+    def test_rfc822_and_iso8601(self):
+        expected = datetime.datetime(2021, 9, 6, 16, 45, tzinfo=UTC)
+        self.assertEqual(parse_timestamp('Mon, 06 Sep 2021 16:45:00 +0000'), expected)
+        self.assertEqual(parse_timestamp('2021-09-06T16:45:00+00:00'), expected)
+        self.assertEqual(parse_timestamp('2021-09-06T16:45:00'), expected)   # 沒有時區時視為 UTC
+
+    def test_unparseable(self):
+        self.assertIsNone(parse_timestamp(''))
+        self.assertIsNone(parse_timestamp('not a date at all'))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# --- END OF FILE tests/test_timestamps.py ---
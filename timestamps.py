@@ -0,0 +1,129 @@
+# --- START OF FILE timestamps.py ---
+# Feed entry 時間戳解析：
+#   - feedparser 的 published_parsed 已經是 UTC 的 struct_time，直接組成 datetime
+#     (舊版用 time.mktime 會把它當成本地時間，在非 UTC 主機上時間是錯的)
+#   - 字串的快速路徑：ISO-8601 (datetime.fromisoformat) 與 RFC-822 (email.utils)
+#   - 每個 feed 記住上次成功的格式，下次優先嘗試；相同字串的結果也有快取
+#   - python-dateutil 只作為最後手段，而且用到時才載入
+
+import calendar
+import datetime
+import email.utils
+import functools
+
+import discord
+
+
+_UTC = datetime.timezone.utc
+
+# feed_key -> 上次成功解析的格式名稱
+_feed_formats = {}
+
+_dateutil_parser = None
+_dateutil_checked = False
+
+
+def _get_dateutil_parser():
+    global _dateutil_parser, _dateutil_checked
+    if not _dateutil_checked:
+        _dateutil_checked = True
+        try:
+            from dateutil import parser as dateutil_parser
+            _dateutil_parser = dateutil_parser
+        except ImportError:
+            print("Warning: 'python-dateutil' not installed. Unusual timestamp formats cannot be parsed. Run: pip install python-dateutil")
+    return _dateutil_parser
+
+
+def _ensure_utc(dt):
+    # 沒有時區資訊時假設是 UTC
+    return dt.replace(tzinfo=_UTC) if dt.tzinfo is None else dt
+
+
+# --- 各種格式的解析器 (失敗時拋出例外) ---
+def _parse_iso8601(value):
+    return _ensure_utc(datetime.datetime.fromisoformat(value))
+
+def _parse_rfc822(value):
+    return _ensure_utc(email.utils.parsedate_to_datetime(value))
+
+def _parse_dateutil(value):
+    parser = _get_dateutil_parser()
+    if parser is None:
+        raise ValueError('python-dateutil not available')
+    return _ensure_utc(parser.parse(value))
+
+_PARSERS = (
+    ('iso8601', _parse_iso8601),
+    ('rfc822', _parse_rfc822),
+    ('dateutil', _parse_dateutil),
+)
+_PARSERS_BY_NAME = dict(_PARSERS)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_string(value, preferred):
+    if preferred:
+        try:
+            return preferred, _PARSERS_BY_NAME[preferred](value)
+        except (ValueError, TypeError, OverflowError):
+            pass
+    for name, parser in _PARSERS:
+        if name == preferred:
+            continue
+        try:
+            return name, parser(value)
+        except (ValueError, TypeError, OverflowError):
+            continue
+    return None, None
+
+
+def parse_timestamp(value, feed_key=None):
+    """把時間字串解析成 timezone-aware 的 datetime；無法解析時回傳 None"""
+    if not value:
+        return None
+    value = value.strip()
+    name, dt = _parse_string(value, _feed_formats.get(feed_key))
+    if name is not None and feed_key is not None:
+        _feed_formats[feed_key] = name
+    return dt
+
+
+def struct_to_datetime(struct):
+    """feedparser 的 *_parsed (UTC struct_time) → timezone-aware datetime"""
+    return datetime.datetime(*struct[:6], tzinfo=_UTC)
+
+
+def entry_epoch(entry):
+    """entry 的發佈時間 (epoch 秒)；沒有解析好的時間時回傳 None"""
+    parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+    return calendar.timegm(parsed) if parsed else None
+
+
+# --- Helper function to parse timestamp ---
+def get_timestamp_from_entry(entry, feed_key=None):
+    """從 feed entry 獲取 datetime 對象，處理可能的錯誤"""
+    dt = None
+    # 優先使用 feedparser 解析好的 time struct
+    published_parsed = entry.get('published_parsed')
+    if published_parsed:
+        try:
+            dt = struct_to_datetime(published_parsed)
+        except (TypeError, ValueError, OverflowError) as e:
+            print(f"Could not convert published_parsed {published_parsed} to timestamp: {e}")
+            dt = None # 轉換失敗，嘗試下一個方法
+
+    # 如果 published_parsed 失敗或不存在，嘗試解析 published 字串
+    if dt is None and entry.get('published'):
+        dt = parse_timestamp(entry.get('published'), feed_key)
+        if dt is None:
+            print(f"Could not parse timestamp string: {entry.get('published')}")
+
+    # 如果所有方法都失敗，返回當前 UTC 時間
+    if dt is None:
+        print(f"Warning: Using current time as timestamp for entry: {entry.get('title', 'N/A')}")
+        dt = discord.utils.utcnow()
+
+    return dt
+
+# --- END OF FILE timestamps.py ---
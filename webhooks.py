@@ -0,0 +1,79 @@
+# --- START OF FILE webhooks.py ---
+# Webhook 發送模式：
+#   每個目標頻道在註冊到路由索引時建立 (或沿用) 一個 Discord webhook，URL 存在 StateStore。
+#   發送時透過共用的 aiohttp session 直接呼叫 webhook，不佔用 bot 本身的 REST rate-limit，
+#   而且一次最多可以帶 10 個 embed，連續的多則更新可以合併成一次請求。
+
+import aiohttp
+import discord
+
+
+WEBHOOK_MAX_EMBEDS = 10           # Discord 單一訊息最多 10 個 embed
+WEBHOOK_MAX_EMBED_CHARS = 6000    # 而且所有 embed 的字數總和不能超過 6000
+
+
+class WebhookRegistry:
+    def __init__(self, state_store, name='SNS 更新通知'):
+        self.state_store = state_store
+        self.name = name
+        self.username = None      # 發送時顯示的名稱與頭像 (on_ready 後設定為 bot 本身)
+        self.avatar_url = None
+        self._webhooks = {}       # channel_id -> discord.Webhook
+        self._session = None
+
+    def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._webhooks = {}
+
+    # --- 註冊 ---
+    async def register(self, channel):
+        """替頻道準備 webhook：優先用快取的 URL，其次沿用頻道裡同名的 webhook，最後才建立新的"""
+        if channel.id in self._webhooks:
+            return self._webhooks[channel.id]
+        url = self.state_store.get_webhook_url(channel.id)
+        if url is None:
+            try:
+                webhook = discord.utils.get(await channel.webhooks(), name=self.name)
+                if webhook is None or not webhook.token:
+                    webhook = await channel.create_webhook(name=self.name, reason='SNS 更新通知 (webhook 模式)')
+            except discord.Forbidden:
+                print(f"權限錯誤: 無法在 {channel.guild.name}/{channel.name} 建立 webhook (需要「管理 Webhook」權限)，改用 bot 發送.")
+                return None
+            except discord.HTTPException as e:
+                print(f"HTTP 錯誤 ({e.status}): 無法在 {channel.guild.name}/{channel.name} 建立 webhook: {e.text}")
+                return None
+            url = webhook.url
+            self.state_store.set_webhook_url(channel.id, url)
+        webhook = discord.Webhook.from_url(url, session=self._ensure_session())
+        self._webhooks[channel.id] = webhook
+        return webhook
+
+    async def register_many(self, channels):
+        for channel in channels:
+            await self.register(channel)
+
+    def get(self, channel_id):
+        return self._webhooks.get(channel_id)
+
+    def forget(self, channel_id):
+        # webhook 被刪除 (404) 時清掉快取，下次註冊會重新建立
+        self._webhooks.pop(channel_id, None)
+        self.state_store.remove_webhook_url(channel_id)
+
+    # --- 發送 ---
+    async def send(self, webhook, embeds):
+        kwargs = {}
+        if self.username:
+            kwargs['username'] = self.username
+        if self.avatar_url:
+            kwargs['avatar_url'] = self.avatar_url
+        await webhook.send(embeds=embeds, **kwargs)
+
+# --- END OF FILE webhooks.py ---
@@ -0,0 +1,219 @@
+# --- START OF FILE websub.py ---
+# YouTube WebSub (PubSubHubbub) 推播：
+#   - 在 bot 程序內跑一個 aiohttp callback 伺服器
+#   - 向 hub 訂閱 YouTube 頻道的 topic，hub 以 GET 驗證訂閱意圖 (回傳 hub.challenge)
+#   - 新影片時 hub 以 POST 推送 Atom，驗證 X-Hub-Signature (HMAC) 後交給與輪詢相同的通知流程
+#   - 依 hub 回傳的 lease_seconds 自動續訂；訂閱失敗時稍後重試
+#   - hub_url 可以設定，方便用本機的替代 hub 測試
+
+import asyncio
+import hashlib
+import hmac
+import secrets
+import urllib.parse
+
+import aiohttp
+
+
+# callback 伺服器用的 aiohttp.web 在 start() 時才載入 (沒有啟用推播時完全不需要)
+web = None
+
+def _load_web():
+    global web
+    if web is None:
+        from aiohttp import web as aiohttp_web
+        web = aiohttp_web
+    return web
+
+
+DEFAULT_HUB_URL = 'https://pubsubhubbub.appspot.com/subscribe'
+
+
+def youtube_topic_for(feed_url):
+    """YouTube RSS URL → WebSub topic URL"""
+    parsed = urllib.parse.urlsplit(feed_url)
+    query = urllib.parse.parse_qs(parsed.query)
+    channel_id = (query.get('channel_id') or [None])[0]
+    if not channel_id:
+        return None
+    return f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"
+
+
+class WebSubSubscriber:
+    def __init__(self, callback_url, on_notification, parse, hub_url=DEFAULT_HUB_URL,
+                 host='0.0.0.0', port=8080, path='/websub', secret=None,
+                 lease_seconds=5 * 24 * 3600, retry_delay=300):
+        self.callback_url = callback_url        # hub 看得到的公開 URL (對應到 host:port/path)
+        self.hub_url = hub_url
+        self.host = host
+        self.port = port
+        self.path = path
+        # 沒有設定時每次啟動產生新的 secret；啟動時會重新訂閱，hub 會改用新的 secret
+        self.secret = secret or secrets.token_hex(20)
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._on_notification = on_notification  # async def on_notification(source, feed)
+        self._parse = parse                       # async def parse(body, content_type, url) -> feed
+        self._topics = {}                         # topic -> FeedSource
+        self._pending_modes = {}                  # topic -> 'subscribe' / 'unsubscribe' (等待 hub 驗證)
+        self._renewals = {}                       # topic -> asyncio.Task
+        self._notify_tasks = set()                # 處理中的推播 (保留參照，stop 時取消)
+        self._session = None
+        self._runner = None
+
+    @property
+    def topics(self):
+        return dict(self._topics)
+
+    def add_topic(self, topic, source):
+        self._topics[topic] = source
+
+    async def remove_topic(self, topic):
+        """停止推播這個 topic (feed 從設定中移除時)；伺服器執行中時向 hub 取消訂閱"""
+        if self._topics.pop(topic, None) is None:
+            return
+        task = self._renewals.pop(topic, None)
+        if task is not None:
+            task.cancel()
+        if self._runner is not None:
+            await self.subscribe(topic, mode='unsubscribe')
+
+    def is_running(self):
+        return self._runner is not None
+
+    # --- 生命週期 ---
+    async def start(self):
+        _load_web()
+        app = web.Application()
+        app.router.add_get(self.path, self._handle_verify)
+        app.router.add_post(self.path, self._handle_notify)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            print(f"Could not start WebSub callback server on {self.host}:{self.port}: {e}. Falling back to polling only.")
+            await self._runner.cleanup()
+            self._runner = None
+            return False
+        print(f"WebSub callback server listening on {self.host}:{self.port}{self.path} ({self.callback_url})")
+        for topic in self._topics:
+            await self.subscribe(topic)
+        return True
+
+    async def stop(self):
+        for task in self._renewals.values():
+            task.cancel()
+        self._renewals = {}
+        for task in list(self._notify_tasks):
+            task.cancel()
+        await asyncio.gather(*self._notify_tasks, return_exceptions=True)
+        self._notify_tasks.clear()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # --- 訂閱 ---
+    async def subscribe(self, topic, mode='subscribe'):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        data = {
+            'hub.callback': self.callback_url,
+            'hub.topic': topic,
+            'hub.mode': mode,
+            'hub.verify': 'async',
+            'hub.secret': self.secret,
+            'hub.lease_seconds': str(self.lease_seconds),
+        }
+        self._pending_modes[topic] = mode
+        try:
+            async with self._session.post(self.hub_url, data=data) as response:
+                if response.status in (202, 204):
+                    print(f"WebSub {mode} request accepted for {topic}")
+                    if mode == 'subscribe':
+                        # 如果 hub 一直沒有來驗證，過一段時間再試一次
+                        self._schedule(topic, self.retry_delay * 4)
+                    return True
+                text = await response.text()
+                print(f"WebSub {mode} request for {topic} failed: HTTP {response.status} {text[:200]}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"WebSub {mode} request for {topic} failed: {e}")
+        if mode == 'subscribe':
+            self._schedule(topic, self.retry_delay)
+        return False
+
+    def _schedule(self, topic, delay):
+        task = self._renewals.pop(topic, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+        async def _renew():
+            await asyncio.sleep(delay)
+            await self.subscribe(topic)
+        self._renewals[topic] = asyncio.create_task(_renew(), name=f'websub-renew:{topic}')
+
+    # --- Callback ---
+    async def _handle_verify(self, request):
+        """hub 驗證訂閱意圖：topic 與 mode 都符合我們的請求時回傳 challenge"""
+        mode = request.query.get('hub.mode')
+        topic = request.query.get('hub.topic')
+        challenge = request.query.get('hub.challenge')
+        if mode == 'denied':
+            print(f"WebSub subscription denied for {topic}: {request.query.get('hub.reason')}")
+            if topic in self._topics:
+                self._schedule(topic, self.retry_delay)
+            return web.Response(text='')
+        if self._pending_modes.get(topic) != mode or challenge is None:
+            return web.Response(status=404)
+        if mode == 'subscribe' and topic not in self._topics:
+            return web.Response(status=404)
+        if mode == 'subscribe':
+            try:
+                lease = int(request.query.get('hub.lease_seconds') or self.lease_seconds)
+            except ValueError:
+                lease = self.lease_seconds
+            # 在租約到期前 (80%) 自動續訂
+            self._schedule(topic, max(60, lease * 0.8))
+            print(f"WebSub subscription verified for {topic} (lease {lease}s)")
+        return web.Response(text=challenge)
+
+    def _valid_signature(self, body, header):
+        if not header or '=' not in header:
+            return False
+        method, signature = header.split('=', 1)
+        if method not in ('sha1', 'sha256', 'sha384', 'sha512'):
+            return False
+        expected = hmac.new(self.secret.encode(), body, getattr(hashlib, method)).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    async def _handle_notify(self, request):
+        body = await request.read()
+        # 依照規範，簽章不符時仍回 2xx，只是忽略內容
+        if not self._valid_signature(body, request.headers.get('X-Hub-Signature')):
+            print("WebSub notification with invalid signature ignored.")
+            return web.Response(status=202)
+        try:
+            feed = await self._parse(body, request.headers.get('Content-Type'), self.callback_url)
+        except Exception as e:
+            print(f"Error parsing WebSub notification: {e}")
+            return web.Response(status=202)
+
+        topic = None
+        for link in feed.feed.get('links', []):
+            if link.get('rel') == 'self' and link.get('href') in self._topics:
+                topic = link['href']
+        # 只訂閱一個 topic 時，缺少 self link 也能對應
+        if topic is None and len(self._topics) == 1:
+            topic = next(iter(self._topics))
+        source = self._topics.get(topic)
+        if source is None or not feed.entries:
+            return web.Response(status=202)
+        task = asyncio.create_task(self._on_notification(source, feed), name=f'websub-notify:{source.key}')
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+        return web.Response(status=202)
+
+# --- END OF FILE websub.py ---